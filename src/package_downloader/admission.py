@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from shutil import disk_usage
+from threading import Condition
+from time import monotonic
+from typing import Iterator
+
+from package_downloader.config import AdmissionConfig
+from package_downloader.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+LEDGER_LOCK_FILENAME = "ledger.lock"
+
+
+def free_bytes(path: Path) -> int:
+    probe = path
+    while not probe.exists() and probe.parent != probe:
+        probe = probe.parent
+    return disk_usage(probe).free
+
+
+class Reservation:
+    """Disk space held for one transfer.
+
+    Only the part not yet written counts against the floor, because the
+    written part already shows up as used space on the volume. A preallocated
+    file is reported as fully written as soon as the allocation succeeds.
+    """
+
+    def __init__(self, controller: AdmissionController | None, nbytes: int) -> None:
+        self._controller = controller
+        self.nbytes = nbytes
+        self.written = 0
+
+    @property
+    def outstanding(self) -> int:
+        return max(self.nbytes - self.written, 0)
+
+    def resize(self, nbytes: int) -> None:
+        if self._controller is None:
+            return
+        with self._controller._cond:
+            self.nbytes = max(nbytes, 0)
+            self._controller._publish()
+            self._controller._cond.notify_all()
+
+    def wrote(self, count: int) -> None:
+        if self._controller is None:
+            return
+        with self._controller._cond:
+            self.written += count
+            if monotonic() - self._controller._published_at >= self._controller.poll_interval:
+                self._controller._publish()
+
+
+class AdmissionLedger:
+    """Outstanding reservations of every process sharing a temp volume.
+
+    Each process owns one file in the directory holding its outstanding byte
+    count. Admission decisions hold an exclusive ``flock`` on the directory's
+    lock file, so two processes cannot both admit into the same headroom.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._own = str(os.getpid())
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        fd = os.open(self.root / LEDGER_LOCK_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def others(self) -> int:
+        total = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.name.isdigit() or entry.name == self._own or not _alive(int(entry.name)):
+                    continue
+                try:
+                    total += int(Path(entry.path).read_text() or 0)
+                except (FileNotFoundError, ValueError):
+                    continue
+        return total
+
+    def publish(self, nbytes: int) -> None:
+        temp_path = self.root / f"{self._own}.tmp"
+        temp_path.write_text(str(nbytes))
+        os.replace(temp_path, self.root / self._own)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Waiter:
+    def __init__(self, nbytes: int) -> None:
+        self.nbytes = nbytes
+        self.since = monotonic()
+
+
+class AdmissionController:
+    """Holds transfers back while they would push the temp volume below its floor.
+
+    Waiters are admitted smallest first, so one large artifact cannot block
+    many small ones. A waiter held longer than ``max_wait`` goes ahead of
+    everyone that arrived after it, so large artifacts are not starved.
+    With ``ledger_dir`` set, reservations held by other processes count
+    against the floor too.
+    """
+
+    def __init__(self, config: AdmissionConfig) -> None:
+        self.enabled = config.enabled
+        self.min_free_bytes = config.min_free_bytes
+        self.poll_interval = config.poll_interval
+        self.max_wait = config.max_wait
+        self._active: list[Reservation] = []
+        self._waiters: list[_Waiter] = []
+        self._cond = Condition()
+        self._ledger = AdmissionLedger(config.ledger_dir) if self.enabled and config.ledger_dir is not None else None
+        self._published_at = 0.0
+
+    @contextmanager
+    def reserve(self, path: Path, nbytes: int) -> Iterator[Reservation]:
+        if not self.enabled:
+            yield Reservation(None, nbytes)
+            return
+
+        waiter = _Waiter(max(nbytes, 0))
+        with self._cond:
+            self._waiters.append(waiter)
+            waited = False
+            try:
+                while self._next() is not waiter or not self._admit(path, waiter.nbytes):
+                    if not waited:
+                        logger.info("Holding %d-byte transfer for %s until disk space frees up.", waiter.nbytes, path.name)
+                        waited = True
+                    self._cond.wait(timeout=self.poll_interval)
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+            reservation = Reservation(self, waiter.nbytes)
+            self._active.append(reservation)
+        try:
+            yield reservation
+        finally:
+            with self._cond:
+                self._active.remove(reservation)
+                self._publish()
+                self._cond.notify_all()
+
+    @contextmanager
+    def attach(self, nbytes: int) -> Iterator[Reservation]:
+        """Account for a second copy of an admitted transfer, such as a hedge, without waiting."""
+        if not self.enabled:
+            yield Reservation(None, nbytes)
+            return
+
+        with self._cond:
+            reservation = Reservation(self, max(nbytes, 0))
+            self._active.append(reservation)
+            self._publish()
+        try:
+            yield reservation
+        finally:
+            with self._cond:
+                self._active.remove(reservation)
+                self._publish()
+                self._cond.notify_all()
+
+    def _next(self) -> _Waiter:
+        now = monotonic()
+        aged = [waiter for waiter in self._waiters if now - waiter.since >= self.max_wait]
+        if aged:
+            return min(aged, key=lambda waiter: waiter.since)
+        return min(self._waiters, key=lambda waiter: (waiter.nbytes, waiter.since))
+
+    def _outstanding(self) -> int:
+        return sum(reservation.outstanding for reservation in self._active)
+
+    def _admit(self, path: Path, nbytes: int) -> bool:
+        if self._ledger is None:
+            return self._fits(path, nbytes, 0)
+        with self._ledger.locked():
+            if not self._fits(path, nbytes, self._ledger.others()):
+                return False
+            # Published before the lock drops, so the next process sees this reservation.
+            self._ledger.publish(self._outstanding() + nbytes)
+            self._published_at = monotonic()
+            return True
+
+    def _publish(self) -> None:
+        if self._ledger is None:
+            return
+        with self._ledger.locked():
+            self._ledger.publish(self._outstanding())
+        self._published_at = monotonic()
+
+    def _fits(self, path: Path, nbytes: int, others: int) -> bool:
+        # Always let one transfer through so an oversized artifact fails instead of deadlocking.
+        if not self._active and not others:
+            return True
+        return free_bytes(path) - self._outstanding() - others - nbytes >= self.min_free_bytes
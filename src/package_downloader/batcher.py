@@ -1,8 +1,12 @@
 from __future__ import annotations
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from hashlib import blake2b
 from pathlib import Path
-from typing import Iterable
+from threading import Event
+from typing import Callable, Iterator
 
 from rich.progress import (
     BarColumn,
@@ -18,117 +22,260 @@ from package_downloader.config import AppConfig
 from package_downloader.errors import append_error
 from package_downloader.io import count_packages, iter_packages
 from package_downloader.logging_utils import get_logger
-from package_downloader.models import BatchResult, DownloadResult, DownloadStatus, ErrorRecord, OffsetState, PackageRecord, RepoType
+from package_downloader.models import BatchResult, DownloadJob, DownloadResult, DownloadStatus, ErrorRecord, OffsetState, PackageRecord, RepoType
 from package_downloader.offsets import load_offset, save_offset
 from package_downloader.repos.base import RepoDownloader
 
 logger = get_logger(__name__)
 
 
-def _run_batch(
+class _RowDeduper:
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._seen: OrderedDict[bytes, None] = OrderedDict()
+
+    def seen(self, package: PackageRecord) -> bool:
+        if self.window <= 0:
+            return False
+        key = blake2b(repr(sorted(package.raw.items())).encode("utf-8"), digest_size=16).digest()
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return True
+        self._seen[key] = None
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+        return False
+
+
+def _group_packages(downloader: RepoDownloader, packages: list[PackageRecord]) -> list[list[PackageRecord]]:
+    groups: dict[str, list[PackageRecord]] = {}
+    ungrouped: list[list[PackageRecord]] = []
+    for pkg in packages:
+        key = downloader.group_key(pkg)
+        if key is None:
+            ungrouped.append([pkg])
+        else:
+            groups.setdefault(key, []).append(pkg)
+    return list(groups.values()) + ungrouped
+
+
+def _future_result(
+    result: BatchResult,
+    pkg: PackageRecord,
+    future: Future,
+    fail_fast: bool,
+) -> DownloadResult | None:
+    try:
+        download_result = future.result()
+    except Exception as exc:
+        logger.exception("Download error for package: %s", pkg.raw)
+        result.errors += 1
+        result.results.append(
+            DownloadResult(
+                package=pkg,
+                status=DownloadStatus.ERROR,
+                message=str(exc),
+            )
+        )
+        if fail_fast:
+            raise
+        return None
+    return download_result
+
+
+def _append_result(
+    repo: RepoType,
+    config: AppConfig,
+    result: BatchResult,
+    download_result: DownloadResult,
+    record_errors: bool,
+) -> None:
+    result.results.append(download_result)
+    if download_result.status == DownloadStatus.ERROR and record_errors:
+        logger.error(
+            "Download failed: %s",
+            download_result.message or "unknown error",
+        )
+        append_error(
+            config.paths.errors_dir,
+            ErrorRecord(
+                repo=repo,
+                message=download_result.message or "unknown error",
+                raw=download_result.package.raw,
+            ),
+        )
+
+
+def run_batch(
     repo: RepoType,
     config: AppConfig,
     downloader: RepoDownloader,
     packages: list[PackageRecord],
-    max_workers: int,
+    resolver: ThreadPoolExecutor,
+    transfers: ThreadPoolExecutor,
     fail_fast: bool,
-    progress: Progress,
-    task_id: TaskID,
+    advance: Callable[[], None],
+    record_errors: bool = True,
 ) -> BatchResult:
     result = BatchResult()
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_map = {executor.submit(downloader.download, pkg): pkg for pkg in packages}
-        for future in as_completed(future_map):
-            pkg = future_map[future]
-            try:
-                download_result = future.result()
-            except Exception as exc:
-                logger.exception("Download error for package: %s", pkg.raw)
-                result.errors += 1
-                result.results.append(
-                    DownloadResult(
-                        package=pkg,
-                        status=DownloadStatus.ERROR,
-                        message=str(exc),
-                    )
-                )
-                if fail_fast:
-                    raise
-            else:
-                result.results.append(download_result)
-                if download_result.status == DownloadStatus.ERROR:
-                    logger.error(
-                        "Download failed: %s",
-                        download_result.message or "unknown error",
-                    )
-                    append_error(
-                        config.paths.errors_dir,
-                        ErrorRecord(
-                            repo=repo,
-                            message=download_result.message or "unknown error",
-                            raw=download_result.package.raw,
-                        ),
-                    )
-            progress.advance(task_id)
+    resolve_map: dict[Future, list[PackageRecord]] = {
+        resolver.submit(downloader.resolve_group, group): group
+        for group in _group_packages(downloader, packages)
+    }
+    transfer_map: dict[Future, PackageRecord] = {}
+    pending: set[Future] = set(resolve_map)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in resolve_map:
+                    group = resolve_map[future]
+                    try:
+                        resolved = future.result()
+                    except Exception as exc:
+                        logger.exception("Resolve error for packages: %s", [pkg.raw for pkg in group])
+                        for pkg in group:
+                            result.errors += 1
+                            result.results.append(
+                                DownloadResult(
+                                    package=pkg,
+                                    status=DownloadStatus.ERROR,
+                                    message=str(exc),
+                                )
+                            )
+                            advance()
+                        if fail_fast:
+                            raise
+                        continue
+                    for item in resolved:
+                        if isinstance(item, DownloadJob):
+                            transfer_future = transfers.submit(downloader.transfer, item)
+                            transfer_map[transfer_future] = item.package
+                            pending.add(transfer_future)
+                        else:
+                            _append_result(repo, config, result, item, record_errors)
+                            advance()
+                    continue
+
+                download_result = _future_result(result, transfer_map[future], future, fail_fast)
+                if download_result is not None:
+                    _append_result(repo, config, result, download_result, record_errors)
+                advance()
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        raise
     return result
 
 
+def new_progress() -> Progress:
+    return Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+    )
+
+
+def start_task(progress: Progress, repo: RepoType, total: int | None, offset: int) -> TaskID:
+    task_id = progress.add_task(f"{repo.value} downloads", total=total)
+    if offset:
+        progress.update(task_id, completed=min(offset, total) if total is not None else offset)
+    return task_id
+
+
+def iter_batches(
+    input_file: Path,
+    config: AppConfig,
+    offset: int,
+    advance: Callable[[], None],
+) -> Iterator[tuple[list[PackageRecord], int]]:
+    """Yield batches with the offset to save once each batch is done.
+
+    Exact duplicate rows are collapsed here and counted toward the offset.
+    A final, possibly empty, batch covers any trailing collapsed rows.
+    """
+    batch: list[PackageRecord] = []
+    processed = 0
+    yielded = 0
+    collapsed = 0
+    deduper = _RowDeduper(config.download.dedupe_window)
+    for index, package in enumerate(iter_packages(input_file, config.input)):
+        if index < offset:
+            continue
+        processed += 1
+        if deduper.seen(package):
+            collapsed += 1
+            advance()
+            continue
+        batch.append(package)
+        if len(batch) >= config.download.batch_size:
+            yield batch, offset + processed
+            yielded = processed
+            batch = []
+
+    if batch or processed != yielded:
+        yield batch, offset + processed
+    if collapsed:
+        logger.info("Collapsed %d duplicate rows.", collapsed)
+
+
 def run_downloads(
     repo: RepoType,
     input_file: Path,
     config: AppConfig,
     downloader: RepoDownloader,
-) -> None:
+    resolver: ThreadPoolExecutor | None = None,
+    transfers: ThreadPoolExecutor | None = None,
+    stop: Event | None = None,
+) -> bool:
+    """Download every row after the saved offset.
+
+    Returns False if ``stop`` was set before the input was exhausted; the
+    offset then covers exactly the finished batches, so a later run resumes
+    where this one left off.
+    """
     offset_state = load_offset(config.paths.offsets_dir, repo)
     offset = max(offset_state.offset, 0)
     total = count_packages(input_file, config.input)
 
-    progress = Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TaskProgressColumn(),
-        TimeElapsedColumn(),
-        TimeRemainingColumn(),
-    )
+    progress = new_progress()
+    with ExitStack() as stack:
+        if resolver is None:
+            resolver = stack.enter_context(
+                ThreadPoolExecutor(
+                    max_workers=config.download.resolve_workers,
+                    thread_name_prefix="resolve",
+                )
+            )
+        if transfers is None:
+            transfers = stack.enter_context(
+                ThreadPoolExecutor(
+                    max_workers=config.download.max_workers,
+                    thread_name_prefix="transfer",
+                )
+            )
+        stack.enter_context(progress)
+        task_id = start_task(progress, repo, total, offset)
+
+        def advance() -> None:
+            progress.advance(task_id)
 
-    with progress:
-        task_id: TaskID = progress.add_task(f"{repo.value} downloads", total=total)
-        if offset:
-            progress.update(task_id, completed=min(offset, total))
-
-        batch: list[PackageRecord] = []
-        processed = 0
-        for index, package in enumerate(iter_packages(input_file, config.input)):
-            if index < offset:
-                continue
-            batch.append(package)
-            if len(batch) >= config.download.batch_size:
-                _run_batch(
+        for batch, batch_offset in iter_batches(input_file, config, offset, advance):
+            if stop is not None and stop.is_set():
+                return False
+            if batch:
+                run_batch(
                     repo,
                     config,
                     downloader,
                     batch,
-                    max_workers=config.download.max_workers,
+                    resolver=resolver,
+                    transfers=transfers,
                     fail_fast=config.download.fail_fast,
-                    progress=progress,
-                    task_id=task_id,
+                    advance=advance,
                 )
-                processed += len(batch)
-                offset_state = OffsetState(offset=offset + processed)
-                save_offset(config.paths.offsets_dir, repo, offset_state)
-                batch = []
-
-        if batch:
-            _run_batch(
-                repo,
-                config,
-                downloader,
-                batch,
-                max_workers=config.download.max_workers,
-                fail_fast=config.download.fail_fast,
-                progress=progress,
-                task_id=task_id,
-            )
-            processed += len(batch)
-            offset_state = OffsetState(offset=offset + processed)
-            save_offset(config.paths.offsets_dir, repo, offset_state)
+                downloader.flush()
+            save_offset(config.paths.offsets_dir, repo, OffsetState(offset=batch_offset))
+    return True
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import json
 from pathlib import Path
 
 import typer
 
 from package_downloader.batcher import run_downloads
 from package_downloader.config import ensure_paths, load_config
-from package_downloader.logging_utils import setup_logging
+from package_downloader.daemon import DaemonRunningError, run_daemon, send_request
+from package_downloader.io import is_stdin
+from package_downloader.logging_utils import get_logger, setup_logging
 from package_downloader.models import RepoType
 from package_downloader.offsets import reset_offset
 from package_downloader.repos import get_downloader
+from package_downloader.server import run_server
+from package_downloader.shards import INDEX_FILENAME, ShardStore, get_shard_store, shard_root
+from package_downloader.snapshot import build_snapshot
+from package_downloader.workers import run_parallel_downloads
+
+logger = get_logger(__name__)
 
 app = typer.Typer(add_completion=False, help="Download packages from package repos.")
 
@@ -26,10 +35,7 @@ def download(
         ...,
         "--file",
         "-f",
-        exists=True,
-        dir_okay=False,
-        readable=True,
-        help="Path to the input CSV file.",
+        help="Input CSV or JSONL file, optionally gzip/bz2/xz compressed, or - for stdin.",
     ),
     reset: bool = typer.Option(
         False,
@@ -41,6 +47,20 @@ def download(
         "--no-verify",
         help="Disable SHA256 verification before moving to output.",
     ),
+    resolve_from: Path | None = typer.Option(
+        None,
+        "--resolve-from",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Resolve URLs from a local index snapshot before querying registries.",
+    ),
+    processes: int | None = typer.Option(
+        None,
+        "--processes",
+        min=1,
+        help="Split rows across this many worker processes.",
+    ),
     config_path: Path = typer.Option(
         Path("configs/config.yaml"),
         "--config",
@@ -51,12 +71,221 @@ def download(
         help="Path to config YAML.",
     ),
 ) -> None:
+    if not is_stdin(file) and not file.is_file():
+        raise typer.BadParameter(f"File '{file}' does not exist.", param_hint="--file")
     setup_logging()
     config = load_config(config_path)
     if no_verify:
         config.download.verify_hash = False
+    if resolve_from:
+        config.download.resolve_from = resolve_from
+    if processes:
+        config.download.processes = processes
     ensure_paths(config)
     if reset:
         reset_offset(config.paths.offsets_dir, repo)
+    if config.download.processes > 1:
+        run_parallel_downloads(repo, file, config)
+        return
     downloader = get_downloader(repo, config)
     run_downloads(repo, file, config, downloader)
+
+
+@app.command("build-snapshot")
+def build_snapshot_command(
+    repo: RepoType = typer.Option(..., "--repo", help="Repo type the index dump describes."),
+    inputs: list[Path] = typer.Option(
+        ...,
+        "--input",
+        "-i",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Index dump as JSONL or CSV. May be repeated.",
+    ),
+    output: Path = typer.Option(..., "--output", "-o", dir_okay=False, help="Snapshot file to write."),
+) -> None:
+    setup_logging()
+    written, skipped = build_snapshot(repo, inputs, output)
+    logger.info("Wrote %d %s entries to %s (%d skipped).", written, repo.value, output, skipped)
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="Address to bind."),
+    port: int = typer.Option(8080, "--port", "-p", help="Port to bind."),
+    offline: bool = typer.Option(
+        False,
+        "--offline",
+        help="Serve only what is already in the output tree; never fetch upstream.",
+    ),
+    config_path: Path = typer.Option(
+        Path("configs/config.yaml"),
+        "--config",
+        "-c",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Path to config YAML.",
+    ),
+) -> None:
+    setup_logging()
+    config = load_config(config_path)
+    ensure_paths(config)
+    run_server(config, host, port, fetch_missing=not offline)
+
+
+@app.command()
+def daemon(
+    inbox: Path | None = typer.Option(
+        None,
+        "--inbox",
+        file_okay=False,
+        help="Directory to watch; drop input files into <inbox>/<repo>/.",
+    ),
+    socket_path: Path | None = typer.Option(
+        None,
+        "--socket",
+        dir_okay=False,
+        help="Unix socket that accepts jobs.",
+    ),
+    no_socket: bool = typer.Option(False, "--no-socket", help="Only watch the inbox."),
+    poll: bool = typer.Option(False, "--poll", help="Poll the inbox instead of using inotify."),
+    config_path: Path = typer.Option(
+        Path("configs/config.yaml"),
+        "--config",
+        "-c",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Path to config YAML.",
+    ),
+) -> None:
+    setup_logging()
+    config = load_config(config_path)
+    if inbox:
+        config.daemon.inbox_dir = inbox
+    if socket_path:
+        config.daemon.socket_path = socket_path
+    if no_socket:
+        config.daemon.socket_path = None
+    if poll:
+        config.daemon.watch = "poll"
+    ensure_paths(config)
+    try:
+        run_daemon(config)
+    except DaemonRunningError as exc:
+        logger.error("%s", exc)
+        raise typer.Exit(code=1)
+
+
+def _daemon_request(request: dict[str, str], socket_path: Path | None, config_path: Path) -> None:
+    if socket_path is None:
+        socket_path = load_config(config_path).daemon.socket_path
+    if socket_path is None:
+        raise typer.BadParameter("No daemon socket configured.", param_hint="--socket")
+    try:
+        reply = send_request(socket_path, request)
+    except OSError as exc:
+        typer.echo(f"Could not reach daemon at {socket_path}: {exc}", err=True)
+        raise typer.Exit(code=1)
+    typer.echo(json.dumps(reply, indent=2))
+    if "error" in reply:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def submit(
+    repo: RepoType = typer.Option(..., "--repo", help="Repo type (pypi, npm, etc)."),
+    file: Path = typer.Option(
+        ...,
+        "--file",
+        "-f",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Input file for the daemon to download.",
+    ),
+    socket_path: Path | None = typer.Option(None, "--socket", dir_okay=False, help="Daemon socket."),
+    config_path: Path = typer.Option(
+        Path("configs/config.yaml"),
+        "--config",
+        "-c",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Path to config YAML.",
+    ),
+) -> None:
+    _daemon_request({"repo": repo.value, "file": str(file.resolve())}, socket_path, config_path)
+
+
+@app.command("job-status")
+def job_status(
+    job_id: str = typer.Argument(..., help="Job id returned by submit."),
+    socket_path: Path | None = typer.Option(None, "--socket", dir_okay=False, help="Daemon socket."),
+    config_path: Path = typer.Option(
+        Path("configs/config.yaml"),
+        "--config",
+        "-c",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Path to config YAML.",
+    ),
+) -> None:
+    _daemon_request({"job": job_id}, socket_path, config_path)
+
+
+def _require_shard_store(repo: RepoType, config_path: Path) -> ShardStore:
+    config = load_config(config_path)
+    config.shards.enabled = True
+    config.shards.repos = [repo.value]
+    root = shard_root(config, repo)
+    if not (root / INDEX_FILENAME).exists():
+        raise typer.BadParameter(f"No shard index at {root}.", param_hint="--repo")
+    return get_shard_store(config, repo)
+
+
+@app.command("shard-lookup")
+def shard_lookup(
+    repo: RepoType = typer.Option(..., "--repo", help="Repo type (pypi, npm, etc)."),
+    name: str = typer.Option(..., "--name", "-n", help="Artifact path relative to the repo output directory."),
+    config_path: Path = typer.Option(
+        Path("configs/config.yaml"),
+        "--config",
+        "-c",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Path to config YAML.",
+    ),
+) -> None:
+    entry = _require_shard_store(repo, config_path).lookup(name)
+    if entry is None:
+        raise typer.Exit(code=1)
+    typer.echo(entry.model_dump_json())
+
+
+@app.command("shard-extract")
+def shard_extract(
+    repo: RepoType = typer.Option(..., "--repo", help="Repo type (pypi, npm, etc)."),
+    name: str = typer.Option(..., "--name", "-n", help="Artifact path relative to the repo output directory."),
+    output: Path = typer.Option(..., "--output", "-o", dir_okay=False, help="File to write."),
+    config_path: Path = typer.Option(
+        Path("configs/config.yaml"),
+        "--config",
+        "-c",
+        exists=True,
+        dir_okay=False,
+        readable=True,
+        help="Path to config YAML.",
+    ),
+) -> None:
+    setup_logging()
+    try:
+        entry = _require_shard_store(repo, config_path).extract(name, output)
+    except KeyError:
+        logger.error("Not found in %s shards: %s", repo.value, name)
+        raise typer.Exit(code=1)
+    logger.info("Extracted %s (%d bytes) to %s.", entry.name, entry.length, output)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
 
 import yaml
 from pydantic import BaseModel, Field
@@ -17,27 +17,100 @@ class PathsConfig(BaseModel):
 class DownloadConfig(BaseModel):
     batch_size: int = Field(default=50, ge=1)
     max_workers: int = Field(default=8, ge=1)
+    resolve_workers: int = Field(default=4, ge=1)
     fail_fast: bool = False
     verify_hash: bool = True
+    dedupe_window: int = Field(default=100_000, ge=0)
+    resolve_from: Path | None = None
+    processes: int = Field(default=1, ge=1)
+    metadata_cache: Path | None = None
+    metadata_ttl: float | None = Field(default=3600.0, gt=0)
+
+
+class StorageConfig(BaseModel):
+    read_chunk_size: int = Field(default=1024 * 1024, ge=4096)
+    write_buffer_size: int = Field(default=1024 * 1024, ge=4096)
+    preallocate: bool = True
+    stage_per_device: bool = True
+    fsync: bool = False
+    fsync_batch_size: int = Field(default=64, ge=1)
+
+
+class AdmissionConfig(BaseModel):
+    enabled: bool = True
+    min_free_bytes: int = Field(default=2 * 1024**3, ge=0)
+    poll_interval: float = Field(default=5.0, gt=0)
+    max_wait: float = Field(default=300.0, ge=0)
+    ledger_dir: Path | None = None
+    estimates: dict[str, int] = Field(
+        default_factory=lambda: {
+            "pypi": 16 * 1024**2,
+            "npm": 4 * 1024**2,
+            "maven": 64 * 1024**2,
+            "docker": 2 * 1024**3,
+        }
+    )
+
+
+class HedgingConfig(BaseModel):
+    enabled: bool = True
+    min_samples: int = Field(default=20, ge=1)
+    window: int = Field(default=200, ge=1)
+    min_delay: float = Field(default=1.0, ge=0)
+    max_ratio: float = Field(default=0.05, ge=0, le=1)
+    burst: int = Field(default=2, ge=0)
+    ewma_alpha: float = Field(default=0.2, gt=0, le=1)
+
+
+class ShardsConfig(BaseModel):
+    enabled: bool = False
+    repos: list[str] = Field(default_factory=lambda: ["npm", "pypi"])
+    max_shard_bytes: int = Field(default=4 * 1024**3, ge=1024**2)
 
 
 class InputConfig(BaseModel):
     has_header: bool = True
+    format: Literal["auto", "csv", "jsonl"] = "auto"
+    buffer_size: int = Field(default=1024 * 1024, ge=4096)
+
+
+class DaemonConfig(BaseModel):
+    inbox_dir: Path = Field(default=Path("data/inbox"))
+    jobs_dir: Path = Field(default=Path("data/jobs"))
+    socket_path: Path | None = Field(default=Path("data/daemon.sock"))
+    watch: Literal["auto", "inotify", "poll"] = "auto"
+    poll_interval: float = Field(default=2.0, gt=0)
 
 
 class PypiConfig(BaseModel):
     cache_size: int = Field(default=256, ge=1)
+    index_url: str = "https://pypi.org"
+    mirrors: dict[str, list[str]] = Field(default_factory=dict)
+
+
+class NpmConfig(BaseModel):
+    registry_url: str = "https://registry.npmjs.org"
+    resolve_packument: bool = False
+    cache_size: int = Field(default=256, ge=1)
+    mirrors: dict[str, list[str]] = Field(default_factory=dict)
 
 
 class MavenConfig(BaseModel):
     registries: list[str] = Field(default_factory=list)
+    mirrors: dict[str, list[str]] = Field(default_factory=dict)
 
 
 class AppConfig(BaseModel):
     paths: PathsConfig = Field(default_factory=PathsConfig)
     download: DownloadConfig = Field(default_factory=DownloadConfig)
+    storage: StorageConfig = Field(default_factory=StorageConfig)
+    admission: AdmissionConfig = Field(default_factory=AdmissionConfig)
+    hedging: HedgingConfig = Field(default_factory=HedgingConfig)
+    shards: ShardsConfig = Field(default_factory=ShardsConfig)
     input: InputConfig = Field(default_factory=InputConfig)
+    daemon: DaemonConfig = Field(default_factory=DaemonConfig)
     pypi: PypiConfig = Field(default_factory=PypiConfig)
+    npm: NpmConfig = Field(default_factory=NpmConfig)
     maven: MavenConfig = Field(default_factory=MavenConfig)
 
 
@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Any
+from uuid import uuid4
+
+from package_downloader.batcher import run_downloads
+from package_downloader.config import AppConfig
+from package_downloader.logging_utils import get_logger
+from package_downloader.models import JobRecord, JobStatus, RepoType
+from package_downloader.repos import get_downloader
+from package_downloader.repos.base import RepoDownloader
+
+logger = get_logger(__name__)
+
+JOB_FILENAME = "job.json"
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class DaemonRunningError(RuntimeError):
+    pass
+
+
+class JobScheduler:
+    """Runs queued jobs one at a time against long-lived downloaders.
+
+    Downloaders (with their HTTP pools and metadata caches) and the resolve
+    and transfer thread pools are created once and shared by every job. Each
+    job keeps its offset, error log and ``job.json`` in its own directory.
+    """
+
+    def __init__(self, config: AppConfig) -> None:
+        self.config = config
+        self.jobs_dir = config.daemon.jobs_dir
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.stop = threading.Event()
+        self._queue: Queue[JobRecord] = Queue()
+        self._downloaders: dict[RepoType, RepoDownloader] = {}
+        self._resolver = ThreadPoolExecutor(
+            max_workers=config.download.resolve_workers,
+            thread_name_prefix="resolve",
+        )
+        self._transfers = ThreadPoolExecutor(
+            max_workers=config.download.max_workers,
+            thread_name_prefix="transfer",
+        )
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.jobs_dir / job_id
+
+    def load(self, job_id: str) -> JobRecord | None:
+        if not job_id or job_id.startswith(".") or "/" in job_id:
+            return None
+        path = self.job_dir(job_id) / JOB_FILENAME
+        if not path.is_file():
+            return None
+        return JobRecord.model_validate_json(path.read_text(encoding="utf-8"))
+
+    def submit(self, repo: RepoType, file: Path, move: bool = False) -> JobRecord:
+        job_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid4().hex[:8]}"
+        job_dir = self.job_dir(job_id)
+        job_dir.mkdir(parents=True)
+        if move:
+            target = job_dir / file.name
+            shutil.move(file, target)
+            file = target
+        job = JobRecord(id=job_id, repo=repo, file=str(file.resolve()))
+        self._save(job)
+        self._queue.put(job.model_copy())
+        logger.info("Queued job %s (%s, %s).", job.id, repo.value, file)
+        return job
+
+    def recover(self) -> int:
+        recovered = 0
+        for path in sorted(self.jobs_dir.glob(f"*/{JOB_FILENAME}")):
+            try:
+                job = JobRecord.model_validate_json(path.read_text(encoding="utf-8"))
+            except Exception:
+                logger.warning("Ignoring unreadable job record %s", path)
+                continue
+            if job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+                job.status = JobStatus.QUEUED
+                self._save(job)
+                self._queue.put(job)
+                recovered += 1
+        return recovered
+
+    def run(self) -> None:
+        while not self.stop.is_set():
+            try:
+                job = self._queue.get(timeout=0.5)
+            except Empty:
+                continue
+            self._run_job(job)
+
+    def close(self, wait: bool = True) -> None:
+        self._resolver.shutdown(wait=wait, cancel_futures=True)
+        self._transfers.shutdown(wait=wait, cancel_futures=True)
+        for downloader in self._downloaders.values():
+            downloader.close()
+
+    def _run_job(self, job: JobRecord) -> None:
+        job.status = JobStatus.RUNNING
+        job.message = None
+        self._save(job)
+        logger.info("Starting job %s.", job.id)
+
+        job_config = self.config.model_copy(deep=True)
+        job_config.paths.offsets_dir = self.job_dir(job.id)
+        job_config.paths.errors_dir = self.job_dir(job.id)
+        try:
+            finished = run_downloads(
+                job.repo,
+                Path(job.file),
+                job_config,
+                self._downloader(job.repo),
+                resolver=self._resolver,
+                transfers=self._transfers,
+                stop=self.stop,
+            )
+        except Exception as exc:
+            logger.exception("Job %s failed.", job.id)
+            job.status = JobStatus.FAILED
+            job.message = str(exc)
+        else:
+            job.status = JobStatus.DONE if finished else JobStatus.QUEUED
+        self._save(job)
+        logger.info("Job %s is %s.", job.id, job.status.value)
+
+    def _downloader(self, repo: RepoType) -> RepoDownloader:
+        downloader = self._downloaders.get(repo)
+        if downloader is None:
+            downloader = get_downloader(repo, self.config)
+            self._downloaders[repo] = downloader
+        return downloader
+
+    def _save(self, job: JobRecord) -> None:
+        job.updated_at = datetime.now(timezone.utc)
+        path = self.job_dir(job.id) / JOB_FILENAME
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(job.model_dump_json(indent=2), encoding="utf-8")
+        os.replace(temp_path, path)
+
+
+class _Inotify:
+    def __init__(self, fd: int, watches: dict[int, Path]) -> None:
+        self.fd = fd
+        self.watches = watches
+
+    @classmethod
+    def open(cls, paths: list[Path]) -> _Inotify | None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init = libc.inotify_init1
+            add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return None
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        watches: dict[int, Path] = {}
+        for path in paths:
+            wd = add_watch(fd, os.fsencode(path), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+            if wd < 0:
+                os.close(fd)
+                return None
+            watches[wd] = path
+        return cls(fd, watches)
+
+    def read(self, timeout: float) -> tuple[list[Path], bool]:
+        """Return the paths named by pending events, and whether the kernel queue overflowed."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        paths: list[Path] = []
+        overflowed = False
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos : pos + length].rstrip(b"\0")
+            pos += length
+            if mask & _IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            base = self.watches.get(wd)
+            if base is not None and name:
+                paths.append(base / os.fsdecode(name))
+        return paths, overflowed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class InboxWatcher:
+    """Turns files dropped into ``<inbox>/<repo>/`` into jobs.
+
+    With inotify a file is picked up once it is closed after writing or
+    renamed into place. The polling fallback waits until a file's size and
+    mtime are unchanged across two polls. Dot-prefixed names are ignored, so
+    writers can use them for partial files.
+    """
+
+    def __init__(self, config: AppConfig, scheduler: JobScheduler) -> None:
+        self.scheduler = scheduler
+        self.poll_interval = config.daemon.poll_interval
+        self.dirs = {repo: config.daemon.inbox_dir / repo.value for repo in RepoType}
+        for path in self.dirs.values():
+            path.mkdir(parents=True, exist_ok=True)
+        self._inotify: _Inotify | None = None
+        if config.daemon.watch != "poll":
+            self._inotify = _Inotify.open(list(self.dirs.values()))
+            if self._inotify is None:
+                if config.daemon.watch == "inotify":
+                    raise RuntimeError("inotify is not available on this system.")
+                logger.info("inotify is not available; polling %s.", config.daemon.inbox_dir)
+
+    def run(self) -> None:
+        try:
+            if self._inotify is not None:
+                self._watch_inotify(self._inotify)
+            else:
+                self._watch_poll()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def _watch_inotify(self, inotify: _Inotify) -> None:
+        # Files that were already there when the daemon started are taken as complete.
+        for path in self._scan():
+            self._submit(path)
+        while not self.scheduler.stop.is_set():
+            paths, overflowed = inotify.read(self.poll_interval)
+            if overflowed:
+                # Events were dropped, so files that arrived during the burst are only found by a rescan.
+                logger.warning("inotify queue overflowed; rescanning the inbox.")
+                paths = self._scan()
+            for path in paths:
+                if path.is_file() and not path.name.startswith("."):
+                    self._submit(path)
+
+    def _watch_poll(self) -> None:
+        seen: dict[Path, tuple[int, int]] = {}
+        while not self.scheduler.stop.is_set():
+            current: dict[Path, tuple[int, int]] = {}
+            for path in self._scan():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                current[path] = (stat.st_size, stat.st_mtime_ns)
+            for path, signature in current.items():
+                if seen.get(path) == signature:
+                    self._submit(path)
+            seen = {path: signature for path, signature in current.items() if path.exists()}
+            self.scheduler.stop.wait(self.poll_interval)
+
+    def _scan(self) -> list[Path]:
+        paths: list[Path] = []
+        for root in self.dirs.values():
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.startswith("."):
+                        paths.append(Path(entry.path))
+        return sorted(paths)
+
+    def _submit(self, path: Path) -> None:
+        try:
+            self.scheduler.submit(RepoType(path.parent.name), path, move=True)
+        except OSError as exc:
+            logger.warning("Could not queue %s: %s", path, exc)
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    server: _JobServer
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except Exception as exc:
+                reply = {"error": str(exc)}
+            self.wfile.write(f"{json.dumps(reply)}\n".encode("utf-8"))
+
+
+class _JobServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, scheduler: JobScheduler) -> None:
+        self.scheduler = scheduler
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _claim_socket(path)
+        super().__init__(str(path), _JobRequestHandler)
+        os.chmod(path, 0o600)
+
+    def dispatch(self, request: dict[str, Any]) -> dict[str, Any]:
+        if "job" in request:
+            job = self.scheduler.load(str(request["job"]))
+            if job is None:
+                return {"error": f"Unknown job: {request['job']}"}
+            return job.model_dump(mode="json")
+        repo = RepoType(request["repo"])
+        file = Path(request["file"])
+        if not file.is_file():
+            return {"error": f"File '{file}' does not exist."}
+        return self.scheduler.submit(repo, file).model_dump(mode="json")
+
+
+def _claim_socket(path: Path) -> None:
+    """Remove a socket left behind by a dead daemon, refusing if one still answers."""
+    if not path.is_socket():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            path.unlink(missing_ok=True)
+            return
+    raise DaemonRunningError(f"Another daemon is accepting jobs on {path}.")
+
+
+def send_request(socket_path: Path, request: dict[str, Any]) -> dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(f"{json.dumps(request)}\n".encode("utf-8"))
+        with client.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError(f"No reply from {socket_path}.")
+    return json.loads(line)
+
+
+def run_daemon(config: AppConfig) -> None:
+    scheduler = JobScheduler(config)
+    watcher = InboxWatcher(config, scheduler)
+    socket_path = config.daemon.socket_path
+    server = _JobServer(socket_path, scheduler) if socket_path is not None else None
+
+    recovered = scheduler.recover()
+    if recovered:
+        logger.info("Resuming %d unfinished jobs.", recovered)
+
+    threads = [threading.Thread(target=watcher.run, name="inbox", daemon=True)]
+    if server is not None:
+        threads.append(threading.Thread(target=server.serve_forever, name="jobs-socket", daemon=True))
+    for thread in threads:
+        thread.start()
+    logger.info(
+        "Watching %s%s.",
+        config.daemon.inbox_dir,
+        f" and accepting jobs on {socket_path}" if server is not None else "",
+    )
+
+    def request_stop(signum: int, frame: object) -> None:
+        if scheduler.stop.is_set():
+            raise KeyboardInterrupt
+        logger.info("Stopping after the current batch; signal again to abort.")
+        scheduler.stop.set()
+
+    previous = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+    aborted = False
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        aborted = True
+        raise
+    finally:
+        scheduler.stop.set()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            socket_path.unlink(missing_ok=True)
+        for thread in threads:
+            thread.join(timeout=config.daemon.poll_interval + 1)
+        # On abort, running transfers are left to die with the process instead of being awaited.
+        scheduler.close(wait=not aborted)
+        logger.info("Daemon stopped.")
@@ -1,37 +1,152 @@
 from __future__ import annotations
 
+import bz2
 import csv
+import gzip
+import io
+import json
+import lzma
+import sys
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterable
+from typing import IO, Any, Iterable, Iterator
 
 from package_downloader.config import InputConfig
+from package_downloader.logging_utils import get_logger
 from package_downloader.models import PackageRecord
 
+logger = get_logger(__name__)
 
-def iter_packages(path: Path, config: InputConfig) -> Iterable[PackageRecord]:
+_COMPRESSED_SUFFIXES = {".gz", ".bz2", ".xz"}
+_JSONL_SUFFIXES = {".jsonl", ".ndjson"}
+
+
+def is_stdin(path: Path) -> bool:
+    return str(path) == "-"
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix.lower() in _COMPRESSED_SUFFIXES
+
+
+def _decompress(raw: IO[bytes]) -> IO[bytes]:
+    magic = raw.peek(6)[:6]  # type: ignore[attr-defined]
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.GzipFile(fileobj=raw, mode="rb")  # type: ignore[return-value]
+    if magic.startswith(b"BZh"):
+        return bz2.BZ2File(raw, mode="rb")  # type: ignore[return-value]
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return lzma.LZMAFile(raw, mode="rb")  # type: ignore[return-value]
+    return raw
+
+
+def _detect_format(path: Path, stream: IO[bytes], config: InputConfig) -> str:
+    if config.format != "auto":
+        return config.format
+    if not is_stdin(path):
+        suffixes = [suffix.lower() for suffix in path.suffixes]
+        if suffixes and suffixes[-1] in _COMPRESSED_SUFFIXES:
+            suffixes = suffixes[:-1]
+        if suffixes and suffixes[-1] in _JSONL_SUFFIXES:
+            return "jsonl"
+        if suffixes and suffixes[-1] == ".csv":
+            return "csv"
+    head = stream.peek(64)  # type: ignore[attr-defined]
+    return "jsonl" if head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"{") else "csv"
+
+
+@contextmanager
+def _open_input(path: Path, config: InputConfig) -> Iterator[tuple[io.TextIOWrapper, str]]:
+    if is_stdin(path):
+        stdin = io.FileIO(sys.stdin.fileno(), mode="rb", closefd=False)
+        raw: IO[bytes] = io.BufferedReader(stdin, buffer_size=config.buffer_size)
+    else:
+        raw = path.open("rb", buffering=config.buffer_size)
+    try:
+        stream = _decompress(raw)
+        if stream is not raw:
+            stream = io.BufferedReader(stream, buffer_size=config.buffer_size)  # type: ignore[arg-type]
+        fmt = _detect_format(path, stream, config)
+        yield io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""), fmt
+    finally:
+        raw.close()
+
+
+def json_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, dict, list)):
+        return value
+    return str(value)
+
+
+def _jsonl_rows(handle: IO[str], warn: bool) -> Iterator[dict[str, Any]]:
+    for lineno, line in enumerate(handle, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            if warn:
+                logger.warning("Skipping malformed JSONL line %d: %s", lineno, exc)
+            continue
+        if not isinstance(row, dict):
+            continue
+        raw = {str(key): json_value(value) for key, value in row.items()}
+        if any(value is not None and str(value).strip() for value in raw.values()):
+            yield raw
+
+
+def _iter_jsonl(handle: IO[str]) -> Iterator[PackageRecord]:
+    for raw in _jsonl_rows(handle, warn=True):
+        yield PackageRecord(
+            sha1_actual=raw.get("sha1_actual") or None,
+            md5_actual=raw.get("md5_actual") or None,
+            sha256=raw.get("sha256") or None,
+            raw=raw,
+        )
+
+
+def _iter_csv(handle: IO[str], config: InputConfig) -> Iterator[PackageRecord]:
     if config.has_header:
-        with path.open("r", encoding="utf-8", newline="") as handle:
-            reader = csv.DictReader(handle)
-            for row in reader:
-                if row is None:
-                    continue
-                if any(value is not None and str(value).strip() for value in row.values()):
-                    yield PackageRecord(
-                        sha1_actual=row.get("sha1_actual") or None,
-                        md5_actual=row.get("md5_actual") or None,
-                        sha256=row.get("sha256") or None,
-                        raw=row,
-                    )
+        reader = csv.DictReader(handle)
+        for row in reader:
+            if row is None:
+                continue
+            if any(value is not None and str(value).strip() for value in row.values()):
+                yield PackageRecord(
+                    sha1_actual=row.get("sha1_actual") or None,
+                    md5_actual=row.get("md5_actual") or None,
+                    sha256=row.get("sha256") or None,
+                    raw=row,
+                )
     else:
-        with path.open("r", encoding="utf-8", newline="") as handle:
-            reader = csv.reader(handle)
-            for row in reader:
-                if not row:
-                    continue
-                if any(value is not None and str(value).strip() for value in row):
-                    raw = {f"column_{idx}": value for idx, value in enumerate(row)}
-                    yield PackageRecord(raw=raw)
-
-
-def count_packages(path: Path, config: InputConfig) -> int:
-    return sum(1 for _ in iter_packages(path, config))
+        reader = csv.reader(handle)
+        for row in reader:
+            if not row:
+                continue
+            if any(value is not None and str(value).strip() for value in row):
+                raw = {f"column_{idx}": value for idx, value in enumerate(row)}
+                yield PackageRecord(raw=raw)
+
+
+def iter_packages(path: Path, config: InputConfig) -> Iterable[PackageRecord]:
+    with _open_input(path, config) as (handle, fmt):
+        if fmt == "jsonl":
+            yield from _iter_jsonl(handle)
+        else:
+            yield from _iter_csv(handle, config)
+
+
+def count_packages(path: Path, config: InputConfig) -> int | None:
+    if is_stdin(path) or is_compressed(path):
+        return None
+    total = 0
+    with _open_input(path, config) as (handle, fmt):
+        if fmt == "jsonl":
+            return sum(1 for _ in _jsonl_rows(handle, warn=False))
+        rows: Iterable[list[str]] = csv.reader(handle)
+        if config.has_header:
+            next(iter(rows), None)
+        for row in rows:
+            if any(value.strip() for value in row):
+                total += 1
+    return total
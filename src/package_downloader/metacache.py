@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class TtlCache(Generic[T]):
+    """In-process LRU of parsed metadata whose entries expire after ``ttl`` seconds.
+
+    Long-lived processes such as the daemon and the mirror server keep their
+    downloaders for hours, so entries must age out like the on-disk cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, T]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, load: Callable[[], T]) -> T:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = load()
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class MetadataCache:
+    """Registry metadata shared between processes through a directory.
+
+    Each key is guarded by an exclusive ``flock``, so when several worker
+    processes ask for the same document only the first one fetches it and the
+    others read the stored copy once the lock is released. Stored copies
+    older than ``ttl`` seconds, or written before ``fresh_since``, are fetched
+    again.
+    """
+
+    def __init__(self, root: Path, ttl: float | None = None) -> None:
+        self.root = root
+        self.ttl = ttl
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str, fetch: Callable[[], bytes], fresh_since: float | None = None) -> bytes:
+        path = self._path(key)
+        lock_fd = os.open(path.with_suffix(".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                mtime = path.stat().st_mtime
+                fresh = fresh_since is None or mtime >= fresh_since
+                if fresh and (self.ttl is None or time.time() - mtime < self.ttl):
+                    return path.read_bytes()
+            except FileNotFoundError:
+                pass
+            body = fetch()
+            temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            temp_path.write_bytes(body)
+            os.replace(temp_path, path)
+            return body
+        finally:
+            os.close(lock_fd)
+
+
+def open_metadata_cache(root: Path | None, ttl: float | None = None) -> MetadataCache | None:
+    if root is None:
+        return None
+    return MetadataCache(root, ttl)
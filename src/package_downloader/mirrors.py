@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from collections import deque
+from threading import Lock
+
+from package_downloader.config import HedgingConfig
+
+_FAILURE_PENALTY = 30.0
+_REFERENCE_BYTES = 1024 * 1024
+
+
+class _HostStats:
+    def __init__(self, window: int) -> None:
+        self.durations: deque[float] = deque(maxlen=window)
+        self.ttfb: float | None = None
+        self.throughput: float | None = None
+
+    def score(self) -> tuple[bool, float]:
+        # Unmeasured hosts sort after measured ones; a stable sort keeps them in configured order.
+        if self.ttfb is None:
+            return True, 0.0
+        throughput = self.throughput or 1.0
+        return False, self.ttfb + _REFERENCE_BYTES / throughput
+
+    def p95(self) -> float | None:
+        if not self.durations:
+            return None
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def _ewma(current: float | None, sample: float, alpha: float) -> float:
+    if current is None:
+        return sample
+    return current + alpha * (sample - current)
+
+
+class MirrorSelector:
+    def __init__(self, mirrors: dict[str, list[str]], config: HedgingConfig) -> None:
+        self.config = config
+        self._groups: list[list[str]] = []
+        for canonical, alternates in mirrors.items():
+            group = [canonical.rstrip("/")]
+            group.extend(alternate.rstrip("/") for alternate in alternates if alternate.rstrip("/") not in group)
+            self._groups.append(group)
+        self._stats: dict[str, _HostStats] = {}
+        self._transfers = 0
+        self._hedges = 0
+        self._lock = Lock()
+
+    def candidates(self, url: str) -> list[str]:
+        for group in self._groups:
+            for base in group:
+                if url.startswith(f"{base}/"):
+                    suffix = url[len(base):]
+                    with self._lock:
+                        ranked = sorted(group, key=lambda host: self._host(host).score())
+                    return [f"{host}{suffix}" for host in ranked]
+        return [url]
+
+    def record(self, url: str, ttfb: float, duration: float, nbytes: int) -> None:
+        alpha = self.config.ewma_alpha
+        with self._lock:
+            stats = self._host(self._base_of(url))
+            stats.ttfb = _ewma(stats.ttfb, ttfb, alpha)
+            if duration > 0 and nbytes > 0:
+                stats.throughput = _ewma(stats.throughput, nbytes / duration, alpha)
+            stats.durations.append(duration)
+
+    def record_probe(self, url: str, ttfb: float) -> None:
+        with self._lock:
+            stats = self._host(self._base_of(url))
+            stats.ttfb = _ewma(stats.ttfb, ttfb, self.config.ewma_alpha)
+
+    def record_cancelled(self, url: str, elapsed: float) -> None:
+        # A hedge loser was at least this slow; keep it in the p95 without penalizing the host.
+        with self._lock:
+            self._host(self._base_of(url)).durations.append(elapsed)
+
+    def record_failure(self, url: str) -> None:
+        alpha = self.config.ewma_alpha
+        with self._lock:
+            stats = self._host(self._base_of(url))
+            stats.ttfb = _ewma(stats.ttfb, _FAILURE_PENALTY, alpha)
+
+    def hedge_delay(self, url: str) -> float | None:
+        if not self.config.enabled:
+            return None
+        with self._lock:
+            stats = self._host(self._base_of(url))
+            if len(stats.durations) < self.config.min_samples:
+                return None
+            p95 = stats.p95()
+        if p95 is None:
+            return None
+        return max(p95, self.config.min_delay)
+
+    def note_transfer(self) -> None:
+        with self._lock:
+            self._transfers += 1
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            allowed = self._hedges < self.config.burst + self._transfers * self.config.max_ratio
+            if allowed:
+                self._hedges += 1
+            return allowed
+
+    def _base_of(self, url: str) -> str:
+        for group in self._groups:
+            for base in group:
+                if url.startswith(f"{base}/"):
+                    return base
+        return "/".join(url.split("/", 3)[:3])
+
+    def _host(self, base: str) -> _HostStats:
+        stats = self._stats.get(base)
+        if stats is None:
+            stats = _HostStats(self.config.window)
+            self._stats[base] = stats
+        return stats
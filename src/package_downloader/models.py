@@ -20,6 +20,13 @@ class DownloadStatus(str, Enum):
     ERROR = "error"
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class PackageRecord(BaseModel):
     sha1_actual: str | None = None
     md5_actual: str | None = None
@@ -27,12 +34,23 @@ class PackageRecord(BaseModel):
     raw: dict[str, Any] = Field(default_factory=dict)
 
 
+class DownloadJob(BaseModel):
+    package: PackageRecord
+    source: str
+    temp_path: str
+    final_path: str
+    size: int | None = None
+    sha256: str | None = None
+
+
 class DownloadResult(BaseModel):
     package: PackageRecord
     status: DownloadStatus
     message: str | None = None
     temp_path: str | None = None
     final_path: str | None = None
+    expected_sha256: str | None = None
+    upstream_status: int | None = None
 
 
 class BatchResult(BaseModel):
@@ -50,3 +68,19 @@ class ErrorRecord(BaseModel):
     message: str
     raw: dict[str, Any] = Field(default_factory=dict)
     recorded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class BatchSummary(BaseModel):
+    downloaded: int = 0
+    skipped: int = 0
+    errors: list[ErrorRecord] = Field(default_factory=list)
+
+
+class JobRecord(BaseModel):
+    id: str
+    repo: RepoType
+    file: str
+    status: JobStatus = JobStatus.QUEUED
+    message: str | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
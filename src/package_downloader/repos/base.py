@@ -1,29 +1,264 @@
 from __future__ import annotations
 
+import os
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 from hashlib import sha256
 from pathlib import Path
-from shutil import move
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, ClassVar
 
+import httpx
+
+from package_downloader.admission import AdmissionController, Reservation
 from package_downloader.config import AppConfig
 from package_downloader.logging_utils import get_logger
-from package_downloader.models import DownloadResult, DownloadStatus, PackageRecord
+from package_downloader.metacache import open_metadata_cache
+from package_downloader.mirrors import MirrorSelector
+from package_downloader.models import DownloadJob, DownloadResult, DownloadStatus, PackageRecord, RepoType
+from package_downloader.shards import get_shard_store
+from package_downloader.singleflight import SingleFlight
+from package_downloader.snapshot import open_snapshot
+from package_downloader.storage import FsyncBatcher, TransferCancelled, content_length, write_response
+
+logger = get_logger(__name__)
 
 
 class RepoDownloader(ABC):
+    repo: ClassVar[RepoType]
+    follow_redirects: ClassVar[bool] = True
+    error_label: ClassVar[str] = "Download failed"
+
     def __init__(self, config: AppConfig) -> None:
         self.config = config
+        self._admission = AdmissionController(config.admission)
+        self._fsync = FsyncBatcher(config.storage)
+        self._flights: SingleFlight[DownloadResult] = SingleFlight()
+        self.snapshot = open_snapshot(config.download.resolve_from)
+        self._mirrors = MirrorSelector(self._mirror_map(), config.hedging)
+        self.shards = get_shard_store(config, self.repo)
+        self.metadata = open_metadata_cache(config.download.metadata_cache, config.download.metadata_ttl)
+        # One keep-alive pool per downloader, shared by its resolve and transfer threads.
+        self.http = httpx.Client(
+            limits=httpx.Limits(
+                max_keepalive_connections=config.download.max_workers + config.download.resolve_workers,
+            ),
+        )
 
     def download(self, package: PackageRecord) -> DownloadResult:
-        result = self._download(package)
-        return self._finalize_download(result)
+        resolved = self.resolve(package)
+        if isinstance(resolved, DownloadResult):
+            return resolved
+        return self.transfer(resolved)
+
+    def group_key(self, package: PackageRecord) -> str | None:
+        return None
+
+    def resolve_group(self, packages: list[PackageRecord]) -> list[DownloadJob | DownloadResult]:
+        return [self.resolve(package) for package in packages]
+
+    def resolve(self, package: PackageRecord) -> DownloadJob | DownloadResult:
+        return self._resolve(package)
+
+    def transfer(self, job: DownloadJob) -> DownloadResult:
+        key = str(Path(job.final_path).resolve())
+        while True:
+            result, shared = self._flights.do(key, lambda: self._transfer_once(job))
+            if not shared:
+                return result
+            # A failure against a different expected digest says nothing about this row.
+            if result.status != DownloadStatus.ERROR or _expected_sha256(result) == _expected_sha256(job):
+                break
+        if result.status == DownloadStatus.DOWNLOADED:
+            return DownloadResult(
+                package=job.package,
+                status=DownloadStatus.SKIPPED,
+                message="Downloaded by a concurrent duplicate request.",
+                final_path=result.final_path,
+            )
+        return result.model_copy(update={"package": job.package})
+
+    def flush(self) -> None:
+        self._fsync.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.http.close()
 
     @abstractmethod
-    def _download(self, package: PackageRecord) -> DownloadResult:
+    def _resolve(self, package: PackageRecord) -> DownloadJob | DownloadResult:
         raise NotImplementedError
 
+    def _snapshot_job(
+        self,
+        package: PackageRecord,
+        key: str,
+        temp_path: Path,
+        target_path: Path,
+    ) -> DownloadJob | None:
+        if self.snapshot is None:
+            return None
+        entry = self.snapshot.lookup(self.repo, key)
+        if entry is None:
+            return None
+        return DownloadJob(
+            package=package,
+            source=entry.url,
+            temp_path=str(temp_path),
+            final_path=str(target_path),
+            size=entry.size,
+            sha256=entry.sha256,
+        )
+
+    def _fetch_metadata(self, url: str, fetch: Callable[[], bytes], fresh_since: float | None = None) -> bytes:
+        if self.metadata is None:
+            return fetch()
+        return self.metadata.get(url, fetch, fresh_since)
+
+    def _shard_name(self, target_path: Path) -> str:
+        return target_path.relative_to(self.config.paths.output_dir / self.repo.value).as_posix()
+
+    def _exists(self, target_path: Path) -> bool:
+        if target_path.exists() or self._fsync.pending(target_path):
+            return True
+        return self.shards is not None and self.shards.contains(self._shard_name(target_path))
+
+    def _transfer_once(self, job: DownloadJob) -> DownloadResult:
+        if self._exists(Path(job.final_path)):
+            return DownloadResult(
+                package=job.package,
+                status=DownloadStatus.SKIPPED,
+                message="File already exists.",
+            )
+        return self._finalize_download(self._transfer(job))
+
+    def _transfer(self, job: DownloadJob) -> DownloadResult:
+        temp_path = Path(job.temp_path)
+        try:
+            # Reserve before any request is sent, so a held job has no upstream response to time out.
+            with self._admission.reserve(temp_path, job.size or self._size_estimate()) as reservation:
+                self._download_file(job.source, temp_path, reservation)
+        except Exception as exc:
+            return DownloadResult(
+                package=job.package,
+                status=DownloadStatus.ERROR,
+                message=f"{self.error_label}: {exc}",
+                upstream_status=upstream_status(exc),
+            )
+
+        return DownloadResult(
+            package=job.package,
+            status=DownloadStatus.DOWNLOADED,
+            temp_path=job.temp_path,
+            final_path=job.final_path,
+            expected_sha256=job.sha256,
+        )
+
+    def _mirror_map(self) -> dict[str, list[str]]:
+        return {}
+
+    def _download_file(self, url: str, target_path: Path, reservation: Reservation) -> None:
+        candidates = self._mirrors.candidates(url)
+        self._mirrors.note_transfer()
+        for index, candidate in enumerate(candidates):
+            backup = candidates[index + 1] if index + 1 < len(candidates) else None
+            try:
+                self._hedged_fetch(candidate, backup, target_path, reservation)
+                return
+            except Exception as exc:
+                if not backup:
+                    raise
+                logger.warning("Transfer from %s failed, trying %s: %s", candidate, backup, exc)
+
+    def _hedged_fetch(self, primary: str, backup: str | None, target_path: Path, reservation: Reservation) -> None:
+        delay = self._mirrors.hedge_delay(primary) if backup else None
+        if delay is None:
+            self._fetch(primary, target_path, reservation)
+            return
+
+        outcomes: Queue[tuple[Path, Exception | None]] = Queue()
+        cancels: list[Event] = []
+        settled = Lock()
+        won: list[Path] = []
+
+        def run(url: str, path: Path, cancel: Event, hedge: bool) -> None:
+            try:
+                # The hedge writes a second full copy, so it carries its own reservation.
+                with self._admission.attach(reservation.nbytes) if hedge else nullcontext(reservation) as own:
+                    self._fetch(url, path, own, cancel)
+            except Exception as exc:
+                path.unlink(missing_ok=True)
+                outcomes.put((path, exc))
+                return
+            with settled:
+                lost = bool(won)
+                won.append(path)
+            if lost:
+                # The other copy already won and nobody reads this outcome.
+                path.unlink(missing_ok=True)
+            else:
+                outcomes.put((path, None))
+
+        def start(url: str) -> None:
+            cancel = Event()
+            path = target_path.with_name(f"{target_path.name}.{len(cancels)}")
+            hedge = bool(cancels)
+            cancels.append(cancel)
+            Thread(target=run, args=(url, path, cancel, hedge), daemon=True).start()
+
+        start(primary)
+        running = 1
+        outcome: tuple[Path, Exception | None] | None = None
+        try:
+            outcome = outcomes.get(timeout=delay)
+        except Empty:
+            if self._mirrors.try_hedge():
+                logger.info("Hedging %s to %s after %.1fs.", primary, backup, delay)
+                start(backup)
+                running += 1
+
+        errors: list[Exception] = []
+        while True:
+            path, error = outcome if outcome is not None else outcomes.get()
+            outcome = None
+            running -= 1
+            if error is None:
+                for cancel in cancels:
+                    cancel.set()
+                os.replace(path, target_path)
+                return
+            errors.append(error)
+            if running == 0:
+                raise errors[0]
+
+    def _fetch(self, url: str, target_path: Path, reservation: Reservation, cancel: Event | None = None) -> None:
+        started = monotonic()
+        try:
+            with self.http.stream("GET", url, timeout=60, follow_redirects=self.follow_redirects) as response:
+                ttfb = monotonic() - started
+                response.raise_for_status()
+                size = content_length(response)
+                if size:
+                    reservation.resize(size)
+                nbytes = write_response(response, target_path, self.config.storage, cancel, reservation.wrote)
+        except TransferCancelled:
+            self._mirrors.record_cancelled(url, monotonic() - started)
+            raise
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code >= 500:
+                self._mirrors.record_failure(url)
+            raise
+        except Exception:
+            self._mirrors.record_failure(url)
+            raise
+        self._mirrors.record(url, ttfb, monotonic() - started, nbytes)
+
+    def _size_estimate(self) -> int:
+        return self.config.admission.estimates.get(self.repo.value, 0)
+
     def _finalize_download(self, result: DownloadResult) -> DownloadResult:
-        logger = get_logger(__name__)
         if result.status != DownloadStatus.DOWNLOADED:
             return result
         if not result.temp_path or not result.final_path:
@@ -31,7 +266,7 @@ class RepoDownloader(ABC):
 
         temp_path = Path(result.temp_path)
         final_path = Path(result.final_path)
-        expected = result.package.sha256 or ""
+        expected = _expected_sha256(result)
 
         if self.config.download.verify_hash and expected:
             actual = self._file_sha256(temp_path)
@@ -47,10 +282,16 @@ class RepoDownloader(ABC):
                     package=result.package,
                     status=DownloadStatus.ERROR,
                     message="SHA256 mismatch.",
+                    expected_sha256=result.expected_sha256,
                 )
 
-        final_path.parent.mkdir(parents=True, exist_ok=True)
-        move(str(temp_path), str(final_path))
+        if self.shards is not None:
+            digest = expected if self.config.download.verify_hash and expected else self._file_sha256(temp_path)
+            self.shards.append(self._shard_name(final_path), temp_path, digest)
+            temp_path.unlink(missing_ok=True)
+            return result
+
+        self._fsync.commit(temp_path, final_path)
         return result
 
     @staticmethod
@@ -60,3 +301,14 @@ class RepoDownloader(ABC):
             for chunk in iter(lambda: handle.read(1024 * 1024), b""):
                 digest.update(chunk)
         return digest.hexdigest()
+
+
+def _expected_sha256(item: DownloadJob | DownloadResult) -> str:
+    fallback = item.sha256 if isinstance(item, DownloadJob) else item.expected_sha256
+    return (item.package.sha256 or fallback or "").strip().lower()
+
+
+def upstream_status(exc: Exception) -> int | None:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return None
@@ -6,8 +6,9 @@ from pathlib import Path
 from pydantic import BaseModel, ConfigDict
 
 from package_downloader.config import AppConfig
-from package_downloader.models import DownloadResult, DownloadStatus, PackageRecord
+from package_downloader.models import DownloadJob, DownloadResult, DownloadStatus, PackageRecord, RepoType
 from package_downloader.repos.base import RepoDownloader
+from package_downloader.storage import staging_dir
 
 
 class DockerCsvRow(BaseModel):
@@ -18,14 +19,16 @@ class DockerCsvRow(BaseModel):
 
 
 class DockerDownloader(RepoDownloader):
+    repo = RepoType.DOCKER
+
     def __init__(self, config: AppConfig) -> None:
         super().__init__(config)
         self.output_dir = self.config.paths.output_dir / "docker"
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.temp_dir = self.config.paths.temp_dir / "docker"
+        self.temp_dir = staging_dir(self.config, "docker")
         self.temp_dir.mkdir(parents=True, exist_ok=True)
 
-    def _download(self, package: PackageRecord) -> DownloadResult:
+    def _resolve(self, package: PackageRecord) -> DownloadJob | DownloadResult:
         try:
             row = DockerCsvRow.model_validate(package.raw)
         except Exception as exc:
@@ -45,32 +48,41 @@ class DockerDownloader(RepoDownloader):
             )
 
         image_ref = f"{repo_name}:{manifest}"
-        filename = _sanitize_filename(f"{manifest}.tar")
-        repo_dir = Path(*repo_name.split("/"))
-        temp_path = self.temp_dir / repo_dir / filename
-        target_path = self.output_dir / repo_dir / filename
-        if target_path.exists():
+        rel_path = _image_rel_path(repo_name, manifest)
+        temp_path = self.temp_dir / rel_path
+        target_path = self.output_dir / rel_path
+        if self._exists(target_path):
             return DownloadResult(
                 package=package,
                 status=DownloadStatus.SKIPPED,
                 message="File already exists.",
             )
 
+        return DownloadJob(
+            package=package,
+            source=image_ref,
+            temp_path=str(temp_path),
+            final_path=str(target_path),
+        )
+
+    def _transfer(self, job: DownloadJob) -> DownloadResult:
+        temp_path = Path(job.temp_path)
         try:
-            _docker_pull(image_ref)
-            _docker_save(image_ref, temp_path)
+            _docker_pull(job.source)
+            with self._admission.reserve(temp_path, self._size_estimate()):
+                _docker_save(job.source, temp_path)
         except Exception as exc:
             return DownloadResult(
-                package=package,
+                package=job.package,
                 status=DownloadStatus.ERROR,
                 message=f"Docker download failed: {exc}",
             )
 
         return DownloadResult(
-            package=package,
+            package=job.package,
             status=DownloadStatus.DOWNLOADED,
-            temp_path=str(temp_path),
-            final_path=str(target_path),
+            temp_path=job.temp_path,
+            final_path=job.final_path,
         )
 
 
@@ -88,6 +100,10 @@ def _docker_save(image_ref: str, target_path: Path) -> None:
     )
 
 
+def _image_rel_path(repo_name: str, manifest: str) -> Path:
+    return Path(*repo_name.split("/")) / _sanitize_filename(f"{manifest}.tar")
+
+
 def _sanitize_filename(value: str) -> str:
     return (
         value.replace("/", "_")
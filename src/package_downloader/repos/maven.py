@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from pathlib import Path
+from time import monotonic
 
 import httpx
 from pydantic import BaseModel, ConfigDict
 
 from package_downloader.config import AppConfig
-from package_downloader.models import DownloadResult, DownloadStatus, PackageRecord
+from package_downloader.models import DownloadJob, DownloadResult, DownloadStatus, PackageRecord, RepoType
 from package_downloader.repos.base import RepoDownloader
+from package_downloader.snapshot import maven_key
+from package_downloader.storage import content_length, staging_dir
 
 
 class MavenCsvRow(BaseModel):
@@ -18,14 +20,20 @@ class MavenCsvRow(BaseModel):
 
 
 class MavenDownloader(RepoDownloader):
+    repo = RepoType.MAVEN
+    error_label = "Maven download error"
+
     def __init__(self, config: AppConfig) -> None:
         super().__init__(config)
         self.output_dir = self.config.paths.output_dir / "maven"
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.temp_dir = self.config.paths.temp_dir / "maven"
+        self.temp_dir = staging_dir(self.config, "maven")
         self.temp_dir.mkdir(parents=True, exist_ok=True)
 
-    def _download(self, package: PackageRecord) -> DownloadResult:
+    def _mirror_map(self) -> dict[str, list[str]]:
+        return self.config.maven.mirrors
+
+    def _resolve(self, package: PackageRecord) -> DownloadJob | DownloadResult:
         try:
             row = MavenCsvRow.model_validate(package.raw)
         except Exception as exc:
@@ -35,62 +43,71 @@ class MavenDownloader(RepoDownloader):
                 message=f"Invalid row for Maven download: {exc}",
             )
 
-        registries = self.config.maven.registries
-        if not registries:
-            return DownloadResult(
-                package=package,
-                status=DownloadStatus.ERROR,
-                message="No Maven registries configured.",
-            )
-
-        rel_path = f"{row.node_path.strip().strip('/')}/{row.node_name.strip()}"
-        rel_path = rel_path.lstrip("/")
+        rel_path = maven_key(row.node_path, row.node_name)
 
         temp_path = self.temp_dir / row.node_path / row.node_name
         target_path = self.output_dir / row.node_path / row.node_name
-        if target_path.exists():
+        if self._exists(target_path):
             return DownloadResult(
                 package=package,
                 status=DownloadStatus.SKIPPED,
                 message="File already exists.",
             )
 
+        job = self._snapshot_job(package, rel_path, temp_path, target_path)
+        if job:
+            return job
+
+        registries = self.config.maven.registries
+        if not registries:
+            return DownloadResult(
+                package=package,
+                status=DownloadStatus.ERROR,
+                message="No Maven registries configured.",
+            )
+
+        # Registries are distinct repositories and keep their configured order; only
+        # the interchangeable mirrors of one registry are ranked by measurements.
         for registry in registries:
-            url = f"{registry.rstrip('/')}/{rel_path}"
+            url = self._mirrors.candidates(f"{registry.rstrip('/')}/{rel_path}")[0]
+            started = monotonic()
             try:
-                _download_file(url, temp_path)
+                size = _probe_file(self.http, url)
             except httpx.HTTPStatusError as exc:
                 if exc.response.status_code == 404:
+                    self._mirrors.record_probe(url, monotonic() - started)
                     continue
+                self._mirrors.record_failure(url)
                 return DownloadResult(
                     package=package,
                     status=DownloadStatus.ERROR,
                     message=f"Maven download error: {exc}",
                 )
             except Exception as exc:
+                self._mirrors.record_failure(url)
                 return DownloadResult(
                     package=package,
                     status=DownloadStatus.ERROR,
                     message=f"Maven download error: {exc}",
                 )
-            return DownloadResult(
+            self._mirrors.record_probe(url, monotonic() - started)
+            return DownloadJob(
                 package=package,
-                status=DownloadStatus.DOWNLOADED,
+                source=url,
                 temp_path=str(temp_path),
                 final_path=str(target_path),
+                size=size,
             )
 
         return DownloadResult(
             package=package,
             status=DownloadStatus.ERROR,
             message="File not found in configured Maven registries.",
+            upstream_status=404,
         )
 
 
-def _download_file(url: str, target_path: Path) -> None:
-    target_path.parent.mkdir(parents=True, exist_ok=True)
-    with httpx.stream("GET", url, timeout=60, follow_redirects=True) as response:
-        response.raise_for_status()
-        with target_path.open("wb") as handle:
-            for chunk in response.iter_bytes():
-                handle.write(chunk)
+def _probe_file(client: httpx.Client, url: str) -> int | None:
+    response = client.head(url, timeout=30, follow_redirects=True)
+    response.raise_for_status()
+    return content_length(response)
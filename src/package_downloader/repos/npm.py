@@ -1,13 +1,16 @@
 from __future__ import annotations
 
-from pathlib import Path
+import time
 
-import httpx
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 from package_downloader.config import AppConfig
-from package_downloader.models import DownloadResult, DownloadStatus, PackageRecord
-from package_downloader.repos.base import RepoDownloader
+from package_downloader.metacache import TtlCache
+from package_downloader.models import DownloadJob, DownloadResult, DownloadStatus, PackageRecord, RepoType
+from package_downloader.repos.base import RepoDownloader, upstream_status
+from package_downloader.singleflight import SingleFlight
+from package_downloader.snapshot import npm_key
+from package_downloader.storage import staging_dir
 
 
 class NpmCsvRow(BaseModel):
@@ -17,15 +20,43 @@ class NpmCsvRow(BaseModel):
     npm_version: str
 
 
+class NpmDist(BaseModel):
+    tarball: str
+
+
+class NpmVersion(BaseModel):
+    dist: NpmDist
+
+
+class NpmPackument(BaseModel):
+    versions: dict[str, NpmVersion] = Field(default_factory=dict)
+
+
 class NpmDownloader(RepoDownloader):
+    repo = RepoType.NPM
+    error_label = "NPM download failed"
+
     def __init__(self, config: AppConfig) -> None:
         super().__init__(config)
         self.output_dir = self.config.paths.output_dir / "npm"
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.temp_dir = self.config.paths.temp_dir / "npm"
+        self.temp_dir = staging_dir(self.config, "npm")
         self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self._packument_flights: SingleFlight[NpmPackument] = SingleFlight()
+        self._packuments: TtlCache[NpmPackument] = TtlCache(
+            self.config.npm.cache_size, self.config.download.metadata_ttl
+        )
 
-    def _download(self, package: PackageRecord) -> DownloadResult:
+    def _mirror_map(self) -> dict[str, list[str]]:
+        return self.config.npm.mirrors
+
+    def group_key(self, package: PackageRecord) -> str | None:
+        if not self.config.npm.resolve_packument:
+            return None
+        name = package.raw.get("npm_name")
+        return str(name).strip() if name else None
+
+    def _resolve(self, package: PackageRecord) -> DownloadJob | DownloadResult:
         try:
             row = NpmCsvRow.model_validate(package.raw)
         except Exception as exc:
@@ -44,46 +75,91 @@ class NpmDownloader(RepoDownloader):
                 message="npm_name or npm_version is missing.",
             )
 
-        base_name = _npm_base_name(npm_name)
-        url = f"https://registry.npmjs.org/{npm_name}/-/{base_name}-{npm_version}.tgz"
-
-        filename = f"{base_name}-{npm_version}.tgz"
+        filename = _npm_filename(npm_name, npm_version)
         temp_path = self.temp_dir / filename
         target_path = self.output_dir / filename
-        if target_path.exists():
+        if self._exists(target_path):
             return DownloadResult(
                 package=package,
                 status=DownloadStatus.SKIPPED,
                 message="File already exists.",
             )
 
-        try:
-            _download_file(url, temp_path)
-        except Exception as exc:
-            return DownloadResult(
-                package=package,
-                status=DownloadStatus.ERROR,
-                message=f"NPM download failed: {exc}",
-            )
+        job = self._snapshot_job(package, npm_key(npm_name, npm_version), temp_path, target_path)
+        if job:
+            return job
 
-        return DownloadResult(
+        base_name = _npm_base_name(npm_name)
+        registry_url = self.config.npm.registry_url.rstrip("/")
+        url = f"{registry_url}/{npm_name}/-/{base_name}-{npm_version}.tgz"
+        if self.config.npm.resolve_packument:
+            try:
+                packument = self._get_packument(npm_name)
+            except Exception as exc:
+                return DownloadResult(
+                    package=package,
+                    status=DownloadStatus.ERROR,
+                    message=f"NPM registry error: {exc}",
+                    upstream_status=upstream_status(exc),
+                )
+            version = packument.versions.get(npm_version)
+            if not version:
+                # The cached packument may predate this version, so ask the registry once more.
+                try:
+                    packument = self._get_packument(npm_name, fresh_since=time.time())
+                except Exception as exc:
+                    return DownloadResult(
+                        package=package,
+                        status=DownloadStatus.ERROR,
+                        message=f"NPM registry error: {exc}",
+                        upstream_status=upstream_status(exc),
+                    )
+                version = packument.versions.get(npm_version)
+            if not version:
+                return DownloadResult(
+                    package=package,
+                    status=DownloadStatus.ERROR,
+                    message=f"Version not found in packument: {npm_name}@{npm_version}",
+                    upstream_status=404,
+                )
+            url = version.dist.tarball
+
+        return DownloadJob(
             package=package,
-            status=DownloadStatus.DOWNLOADED,
+            source=url,
             temp_path=str(temp_path),
             final_path=str(target_path),
         )
 
+    def _get_packument(self, npm_name: str, fresh_since: float | None = None) -> NpmPackument:
+        if fresh_since is not None:
+            self._packuments.invalidate(npm_name)
+        packument, _ = self._packument_flights.do(
+            (npm_name, fresh_since is not None),
+            lambda: self._packuments.get(npm_name, lambda: self._fetch_packument(npm_name, fresh_since)),
+        )
+        return packument
+
+    def _fetch_packument(self, npm_name: str, fresh_since: float | None = None) -> NpmPackument:
+        url = f"{self.config.npm.registry_url.rstrip('/')}/{npm_name}"
+
+        def fetch() -> bytes:
+            response = self.http.get(
+                url,
+                headers={"Accept": "application/vnd.npm.install-v1+json"},
+                timeout=30,
+            )
+            response.raise_for_status()
+            return response.content
+
+        return NpmPackument.model_validate_json(self._fetch_metadata(url, fetch, fresh_since))
+
+
+def _npm_filename(npm_name: str, npm_version: str) -> str:
+    return f"{_npm_base_name(npm_name)}-{npm_version}.tgz"
+
 
 def _npm_base_name(npm_name: str) -> str:
     if npm_name.startswith("@") and "/" in npm_name:
         return npm_name.split("/", 1)[1]
     return npm_name
-
-
-def _download_file(url: str, target_path: Path) -> None:
-    target_path.parent.mkdir(parents=True, exist_ok=True)
-    with httpx.stream("GET", url, timeout=60, follow_redirects=True) as response:
-        response.raise_for_status()
-        with target_path.open("wb") as handle:
-            for chunk in response.iter_bytes():
-                handle.write(chunk)
@@ -2,16 +2,17 @@ from __future__ import annotations
 
 from __future__ import annotations
 
-from functools import lru_cache
-from pathlib import Path
-from threading import Event, Lock
+import time
 
-import httpx
 from pydantic import BaseModel, ConfigDict, Field
 
 from package_downloader.config import AppConfig
-from package_downloader.models import DownloadResult, DownloadStatus, PackageRecord
-from package_downloader.repos.base import RepoDownloader
+from package_downloader.metacache import TtlCache
+from package_downloader.models import DownloadJob, DownloadResult, DownloadStatus, PackageRecord, RepoType
+from package_downloader.repos.base import RepoDownloader, upstream_status
+from package_downloader.singleflight import SingleFlight
+from package_downloader.snapshot import pypi_key
+from package_downloader.storage import staging_dir
 
 
 class PypiCsvRow(BaseModel):
@@ -24,6 +25,8 @@ class PypiCsvRow(BaseModel):
 class PypiReleaseFile(BaseModel):
     filename: str
     url: str
+    size: int | None = None
+    digests: dict[str, str] = Field(default_factory=dict)
 
 
 class PypiResponse(BaseModel):
@@ -31,17 +34,28 @@ class PypiResponse(BaseModel):
 
 
 class PyPIDownloader(RepoDownloader):
+    repo = RepoType.PYPI
+    follow_redirects = False
+
     def __init__(self, config: AppConfig) -> None:
         super().__init__(config)
         self.output_dir = self.config.paths.output_dir / "pypi"
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.temp_dir = self.config.paths.temp_dir / "pypi"
+        self.temp_dir = staging_dir(self.config, "pypi")
         self.temp_dir.mkdir(parents=True, exist_ok=True)
-        self._inflight: dict[str, Event] = {}
-        self._lock = Lock()
-        self._cached_fetch = lru_cache(maxsize=self.config.pypi.cache_size)(self._fetch_pypi_payload)
+        self._payload_flights: SingleFlight[PypiResponse] = SingleFlight()
+        self._payloads: TtlCache[PypiResponse] = TtlCache(
+            self.config.pypi.cache_size, self.config.download.metadata_ttl
+        )
+
+    def _mirror_map(self) -> dict[str, list[str]]:
+        return self.config.pypi.mirrors
 
-    def _download(self, package: PackageRecord) -> DownloadResult:
+    def group_key(self, package: PackageRecord) -> str | None:
+        name = package.raw.get("pypi_name")
+        return str(name).strip() if name else None
+
+    def _resolve(self, package: PackageRecord) -> DownloadJob | DownloadResult:
         try:
             row = PypiCsvRow.model_validate(package.raw)
         except Exception as exc:
@@ -51,6 +65,19 @@ class PyPIDownloader(RepoDownloader):
                 message=f"Invalid row for PyPI download: {exc}",
             )
 
+        target_path = self.output_dir / row.node_name
+        if self._exists(target_path):
+            return DownloadResult(
+                package=package,
+                status=DownloadStatus.SKIPPED,
+                message="File already exists.",
+            )
+
+        temp_path = self.temp_dir / row.node_name
+        job = self._snapshot_job(package, pypi_key(row.node_name), temp_path, target_path)
+        if job:
+            return job
+
         try:
             payload = self._get_pypi_payload(row.pypi_name)
         except Exception as exc:
@@ -58,84 +85,63 @@ class PyPIDownloader(RepoDownloader):
                 package=package,
                 status=DownloadStatus.ERROR,
                 message=f"PyPI API error: {exc}",
+                upstream_status=upstream_status(exc),
             )
 
-        download_url = _find_release_url(payload, row.node_name)
-        if not download_url:
+        release = _find_release(payload, row.node_name)
+        if not release:
+            # The cached metadata may predate this release, so ask upstream once more.
+            try:
+                payload = self._get_pypi_payload(row.pypi_name, fresh_since=time.time())
+            except Exception as exc:
+                return DownloadResult(
+                    package=package,
+                    status=DownloadStatus.ERROR,
+                    message=f"PyPI API error: {exc}",
+                    upstream_status=upstream_status(exc),
+                )
+            release = _find_release(payload, row.node_name)
+        if not release:
             return DownloadResult(
                 package=package,
                 status=DownloadStatus.ERROR,
                 message=f"Release not found for filename: {row.node_name}",
+                upstream_status=404,
             )
 
-        target_path = self.output_dir / row.node_name
-        if target_path.exists():
-            return DownloadResult(
-                package=package,
-                status=DownloadStatus.SKIPPED,
-                message="File already exists.",
-            )
-
-        try:
-            temp_path = self.temp_dir / row.node_name
-            _download_file(download_url, temp_path)
-        except Exception as exc:
-            return DownloadResult(
-                package=package,
-                status=DownloadStatus.ERROR,
-                message=f"Download failed: {exc}",
-            )
-
-        return DownloadResult(
+        return DownloadJob(
             package=package,
-            status=DownloadStatus.DOWNLOADED,
+            source=release.url,
             temp_path=str(temp_path),
             final_path=str(target_path),
+            size=release.size,
+            sha256=release.digests.get("sha256"),
         )
 
-    def _get_pypi_payload(self, pypi_name: str) -> PypiResponse:
+    def _get_pypi_payload(self, pypi_name: str, fresh_since: float | None = None) -> PypiResponse:
         cache_key = pypi_name.strip()
-        with self._lock:
-            event = self._inflight.get(cache_key)
-            if event:
-                wait_event = event
-                do_request = False
-            else:
-                wait_event = Event()
-                self._inflight[cache_key] = wait_event
-                do_request = True
-
-        if not do_request:
-            wait_event.wait()
-            return self._cached_fetch(cache_key)
-
-        try:
-            payload = self._cached_fetch(cache_key)
-        finally:
-            with self._lock:
-                wait_event.set()
-                self._inflight.pop(cache_key, None)
+        if fresh_since is not None:
+            self._payloads.invalidate(cache_key)
+        payload, _ = self._payload_flights.do(
+            (cache_key, fresh_since is not None),
+            lambda: self._payloads.get(cache_key, lambda: self._fetch_pypi_payload(cache_key, fresh_since)),
+        )
         return payload
 
-    def _fetch_pypi_payload(self, pypi_name: str) -> PypiResponse:
-        api_url = f"https://pypi.org/pypi/{pypi_name}/json"
-        response = httpx.get(api_url, timeout=30)
-        response.raise_for_status()
-        return PypiResponse.model_validate(response.json())
+    def _fetch_pypi_payload(self, pypi_name: str, fresh_since: float | None = None) -> PypiResponse:
+        api_url = f"{self.config.pypi.index_url.rstrip('/')}/pypi/{pypi_name}/json"
 
+        def fetch() -> bytes:
+            response = self.http.get(api_url, timeout=30)
+            response.raise_for_status()
+            return response.content
 
-def _find_release_url(payload: PypiResponse, filename: str) -> str | None:
+        return PypiResponse.model_validate_json(self._fetch_metadata(api_url, fetch, fresh_since))
+
+
+def _find_release(payload: PypiResponse, filename: str) -> PypiReleaseFile | None:
     for files in payload.releases.values():
         for file in files:
             if file.filename == filename:
-                return file.url
+                return file
     return None
-
-
-def _download_file(url: str, target_path: Path) -> None:
-    target_path.parent.mkdir(parents=True, exist_ok=True)
-    with httpx.stream("GET", url, timeout=60) as response:
-        response.raise_for_status()
-        with target_path.open("wb") as handle:
-            for chunk in response.iter_bytes():
-                handle.write(chunk)
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import asyncio
+import html
+import os
+import re
+import threading
+from email.utils import formatdate
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import quote, unquote, urlsplit
+
+import httpx
+
+from package_downloader.config import AppConfig
+from package_downloader.logging_utils import get_logger
+from package_downloader.models import DownloadResult, DownloadStatus, PackageRecord, RepoType
+from package_downloader.repos import get_downloader
+from package_downloader.repos.base import RepoDownloader
+from package_downloader.shards import INDEX_FILENAME, get_shard_store, shard_root
+
+logger = get_logger(__name__)
+
+_SERVED_REPOS = (RepoType.PYPI, RepoType.NPM, RepoType.MAVEN)
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+_ANCHOR_RE = re.compile(r"<a\s[^>]*>.*?</a>", re.IGNORECASE | re.DOTALL)
+_HREF_RE = re.compile(r'href="([^"]*)"', re.IGNORECASE)
+# Metadata files are not mirrored, so clients must not be told to fetch them.
+_METADATA_ATTR_RE = re.compile(r'\s+data-(?:dist-info|core)-metadata(?:="[^"]*")?', re.IGNORECASE)
+_REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    416: "Range Not Satisfiable",
+    502: "Bad Gateway",
+}
+
+
+class _Located(NamedTuple):
+    path: Path
+    offset: int
+    length: int
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str = "") -> None:
+        super().__init__(message or _REASONS.get(status, ""))
+        self.status = status
+
+
+def _normalize_project(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _project_of(filename: str) -> str | None:
+    if filename.endswith(".whl"):
+        return _normalize_project(filename.split("-", 1)[0])
+    for suffix in (".tar.gz", ".zip", ".tar.bz2", ".tgz"):
+        if filename.endswith(suffix):
+            stem = filename[: -len(suffix)]
+            if "-" in stem:
+                return _normalize_project(stem.rsplit("-", 1)[0])
+    return None
+
+
+def _safe_join(root: Path, parts: list[str]) -> Path:
+    if not parts or any(not part or part.startswith(".") for part in parts):
+        raise _HttpError(404)
+    if parts[-1].endswith(".partial"):
+        raise _HttpError(404)
+    return root.joinpath(*parts)
+
+
+def _mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _rewrite_simple_links(page: str, project: str) -> tuple[list[str], set[str]]:
+    """Point every file link of an upstream simple page at this server's read-through path."""
+    links: list[str] = []
+    names: set[str] = set()
+    for anchor in _ANCHOR_RE.findall(page):
+        anchor = _METADATA_ATTR_RE.sub("", anchor)
+        match = _HREF_RE.search(anchor)
+        if match is None:
+            continue
+        url = urlsplit(html.unescape(match.group(1)))
+        filename = unquote(url.path.rsplit("/", 1)[-1])
+        if not filename:
+            continue
+        href = f"/pypi/files/{quote(project)}/{quote(filename)}"
+        if url.fragment:
+            href += f"#{url.fragment}"
+        links.append(anchor[: match.start()] + f'href="{html.escape(href)}"' + anchor[match.end() :])
+        names.add(filename)
+    return links, names
+
+
+def _simple_page(links: list[str]) -> bytes:
+    body = "<!DOCTYPE html>\n<html><body>\n" + "<br/>\n".join(links) + "\n</body></html>\n"
+    return body.encode("utf-8")
+
+
+class MirrorServer:
+    def __init__(self, config: AppConfig, fetch_missing: bool = True) -> None:
+        self.config = config
+        self.fetch_missing = fetch_missing
+        self.roots = {repo: config.paths.output_dir / repo.value for repo in _SERVED_REPOS}
+        self._downloaders: dict[RepoType, RepoDownloader] = {}
+        self._inflight: dict[str, asyncio.Future[_Located]] = {}
+        self._pypi_index: dict[str, set[str]] | None = None
+        self._pypi_stamp: tuple[int, ...] = ()
+        self._pypi_lock = threading.Lock()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info("Serving %s on http://%s:%d", self.config.paths.output_dir, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = await self._handle_request(request_line.decode("latin-1"), headers, writer)
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line: str, headers: dict[str, str], writer: asyncio.StreamWriter) -> bool:
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            await self._send_error(writer, _HttpError(400), head=False)
+            return False
+
+        head = method == "HEAD"
+        try:
+            if method not in ("GET", "HEAD"):
+                raise _HttpError(405)
+            path = unquote(urlsplit(target).path)
+            parts = [part for part in path.split("/") if part]
+            if parts[:2] == ["pypi", "simple"]:
+                await self._send_body(writer, 200, await self._pypi_simple(parts[2:]), "text/html", head)
+                return True
+            located = await self._resolve_file(parts)
+            await self._send_file(writer, located, headers.get("range"), head)
+        except _HttpError as exc:
+            await self._send_error(writer, exc, head)
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as exc:
+            logger.exception("Request failed: %s", request_line.strip())
+            await self._send_error(writer, _HttpError(502, str(exc)), head)
+        return True
+
+    async def _resolve_file(self, parts: list[str]) -> _Located:
+        if len(parts) < 2:
+            raise _HttpError(404)
+        repo_name, rest = parts[0], parts[1:]
+
+        if repo_name == RepoType.PYPI.value and rest[0] == "files" and len(rest) == 3:
+            project, filename = rest[1], rest[2]
+            target = _safe_join(self.roots[RepoType.PYPI], [filename])
+            raw = {"pypi_name": project, "node_name": filename}
+            return await self._local_or_fetch(RepoType.PYPI, target, raw)
+
+        if repo_name == RepoType.NPM.value and "-" in rest and len(rest) >= 3:
+            split = rest.index("-")
+            npm_name = "/".join(rest[:split])
+            filename = rest[-1]
+            base_name = rest[split - 1]
+            prefix = f"{base_name}-"
+            if split != len(rest) - 2 or not filename.startswith(prefix) or not filename.endswith(".tgz"):
+                raise _HttpError(404)
+            target = _safe_join(self.roots[RepoType.NPM], [filename])
+            raw = {"npm_name": npm_name, "npm_version": filename[len(prefix) : -len(".tgz")]}
+            return await self._local_or_fetch(RepoType.NPM, target, raw)
+
+        if repo_name == RepoType.MAVEN.value and len(rest) >= 2:
+            target = _safe_join(self.roots[RepoType.MAVEN], rest)
+            raw = {"node_path": "/".join(rest[:-1]), "node_name": rest[-1]}
+            return await self._local_or_fetch(RepoType.MAVEN, target, raw)
+
+        raise _HttpError(404)
+
+    def _locate(self, repo: RepoType, target: Path) -> _Located | None:
+        if target.is_file():
+            return _Located(target, 0, target.stat().st_size)
+        store = get_shard_store(self.config, repo)
+        if store is None:
+            return None
+        entry = store.lookup(target.relative_to(self.roots[repo]).as_posix())
+        if entry is None:
+            return None
+        return _Located(store.shard_path(entry.shard), entry.offset, entry.length)
+
+    async def _local_or_fetch(self, repo: RepoType, target: Path, raw: dict[str, str]) -> _Located:
+        located = self._locate(repo, target)
+        if located is not None:
+            return located
+        if not self.fetch_missing:
+            raise _HttpError(404)
+
+        key = str(target)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(repo, target, raw))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, repo: RepoType, target: Path, raw: dict[str, str]) -> _Located:
+        downloader = self._downloader(repo)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self._download, downloader, PackageRecord(raw=raw))
+        located = self._locate(repo, target)
+        if located is not None:
+            return located
+        logger.warning("Upstream fetch failed for %s: %s", target, result.message)
+        not_found = result.status == DownloadStatus.SKIPPED or result.upstream_status == 404
+        raise _HttpError(404 if not_found else 502, result.message or "")
+
+    @staticmethod
+    def _download(downloader: RepoDownloader, package: PackageRecord) -> DownloadResult:
+        result = downloader.download(package)
+        # Batched fsync commits are deferred; the file must be in place before it is served.
+        downloader.flush()
+        return result
+
+    def _downloader(self, repo: RepoType) -> RepoDownloader:
+        downloader = self._downloaders.get(repo)
+        if downloader is None:
+            downloader = get_downloader(repo, self.config)
+            self._downloaders[repo] = downloader
+        return downloader
+
+    async def _pypi_simple(self, parts: list[str]) -> bytes:
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(None, self._pypi_files)
+        if not parts:
+            links = [f'<a href="{html.escape(name)}/">{html.escape(name)}</a>' for name in sorted(index)]
+            return _simple_page(links)
+
+        project = _normalize_project(parts[0])
+        local = index.get(project, set())
+        links: list[str] = []
+        listed: set[str] = set()
+        if self.fetch_missing:
+            downloader = self._downloader(RepoType.PYPI)
+            try:
+                page = await loop.run_in_executor(None, self._pypi_upstream, downloader, project)
+            except httpx.HTTPStatusError as exc:
+                if exc.response.status_code != 404 and not local:
+                    raise _HttpError(502, str(exc)) from exc
+            except httpx.HTTPError as exc:
+                if not local:
+                    raise _HttpError(502, str(exc)) from exc
+            else:
+                links, listed = _rewrite_simple_links(page, project)
+
+        links.extend(
+            f'<a href="/pypi/files/{html.escape(project)}/{html.escape(quote(name))}">{html.escape(name)}</a>'
+            for name in sorted(local - listed)
+        )
+        if not links:
+            raise _HttpError(404)
+        return _simple_page(links)
+
+    def _pypi_files(self) -> dict[str, set[str]]:
+        # Rescanned whenever the tree or the shard index changes, so files written by other runs show up.
+        root = self.roots[RepoType.PYPI]
+        shards = shard_root(self.config, RepoType.PYPI)
+        stamp = tuple(_mtime_ns(path) for path in (root, shards / INDEX_FILENAME, shards / f"{INDEX_FILENAME}-wal"))
+        with self._pypi_lock:
+            if self._pypi_index is not None and stamp == self._pypi_stamp:
+                return self._pypi_index
+
+            index: dict[str, set[str]] = {}
+            if root.is_dir():
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        project = _project_of(entry.name) if entry.is_file() else None
+                        if project:
+                            index.setdefault(project, set()).add(entry.name)
+            store = get_shard_store(self.config, RepoType.PYPI)
+            for name in store.names() if store is not None else ():
+                project = _project_of(name)
+                if project:
+                    index.setdefault(project, set()).add(name)
+            self._pypi_index, self._pypi_stamp = index, stamp
+            return index
+
+    def _pypi_upstream(self, downloader: RepoDownloader, project: str) -> str:
+        url = f"{self.config.pypi.index_url.rstrip('/')}/simple/{project}/"
+        response = downloader.http.get(url, headers={"Accept": "text/html"}, timeout=30, follow_redirects=True)
+        response.raise_for_status()
+        return response.text
+
+    async def _send_file(self, writer: asyncio.StreamWriter, located: _Located, range_header: str | None, head: bool) -> None:
+        size = located.length
+        start, end = 0, size - 1
+        status = 200
+        extra: dict[str, str] = {"Accept-Ranges": "bytes"}
+        if range_header:
+            match = _RANGE_RE.match(range_header.strip())
+            if not match or (not match.group(1) and not match.group(2)):
+                raise _HttpError(416)
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start > end or start >= size:
+                extra["Content-Range"] = f"bytes */{size}"
+                await self._send_headers(writer, 416, 0, "text/plain", extra)
+                return
+            status = 206
+            extra["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        length = end - start + 1 if size else 0
+        await self._send_headers(writer, status, length, "application/octet-stream", extra)
+        if head or not length:
+            return
+        with located.path.open("rb") as handle:
+            await asyncio.get_running_loop().sendfile(writer.transport, handle, located.offset + start, length)
+
+    async def _send_headers(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        length: int,
+        content_type: str,
+        extra: dict[str, str] | None = None,
+    ) -> None:
+        lines = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+            f"Date: {formatdate(usegmt=True)}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {length}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in (extra or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def _send_body(self, writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str, head: bool) -> None:
+        await self._send_headers(writer, status, len(body), content_type)
+        if not head:
+            writer.write(body)
+            await writer.drain()
+
+    async def _send_error(self, writer: asyncio.StreamWriter, error: _HttpError, head: bool) -> None:
+        body = f"{error.status} {error}\n".encode("utf-8")
+        await self._send_body(writer, error.status, body, "text/plain", head)
+
+
+def run_server(config: AppConfig, host: str, port: int, fetch_missing: bool = True) -> None:
+    asyncio.run(MirrorServer(config, fetch_missing).serve(host, port))
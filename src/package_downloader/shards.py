@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from pydantic import BaseModel
+
+from package_downloader.config import AppConfig
+from package_downloader.models import RepoType
+from package_downloader.storage import copy_range
+
+SHARDS_DIRNAME = ".shards"
+INDEX_FILENAME = "index.db"
+APPEND_LOCK_FILENAME = "append.lock"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+class ShardEntry(BaseModel):
+    name: str
+    shard: int
+    offset: int
+    length: int
+    sha256: str
+
+
+class ShardStore:
+    def __init__(self, root: Path, max_shard_bytes: int, fsync: bool = False) -> None:
+        self.root = root
+        self.max_shard_bytes = max_shard_bytes
+        self.fsync = fsync
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(_SCHEMA)
+        row = self._connection().execute("SELECT MAX(shard) FROM entries").fetchone()
+        self._active = row[0] or 0
+
+    def shard_path(self, shard: int) -> Path:
+        return self.root / f"shard-{shard:05d}.pack"
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.root / INDEX_FILENAME, timeout=60)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, name: str) -> ShardEntry | None:
+        row = self._connection().execute(
+            "SELECT name, shard, offset, length, sha256 FROM entries WHERE name = ?",
+            (name,),
+        ).fetchone()
+        if row is None:
+            return None
+        return ShardEntry(name=row[0], shard=row[1], offset=row[2], length=row[3], sha256=row[4])
+
+    def contains(self, name: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM entries WHERE name = ?", (name,)).fetchone() is not None
+
+    def names(self) -> Iterator[str]:
+        for (name,) in self._connection().execute("SELECT name FROM entries ORDER BY name"):
+            yield name
+
+    def append(self, name: str, source: Path, sha256: str) -> ShardEntry:
+        with self._write_lock, self._append_lock():
+            existing = self.lookup(name)
+            if existing is not None:
+                return existing
+
+            # Other processes may have rolled over to a newer shard since we last looked.
+            row = self._connection().execute("SELECT MAX(shard) FROM entries").fetchone()
+            self._active = max(self._active, row[0] or 0)
+            length = source.stat().st_size
+            shard_path = self.shard_path(self._active)
+            if shard_path.exists() and shard_path.stat().st_size + length > self.max_shard_bytes:
+                self._active += 1
+                shard_path = self.shard_path(self._active)
+
+            dst_fd = os.open(shard_path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                offset = os.fstat(dst_fd).st_size
+                with source.open("rb") as src:
+                    copy_range(src.fileno(), dst_fd, length, dst_offset=offset)
+                if self.fsync:
+                    os.fsync(dst_fd)
+            finally:
+                os.close(dst_fd)
+
+            entry = ShardEntry(name=name, shard=self._active, offset=offset, length=length, sha256=sha256.lower())
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                    (entry.name, entry.shard, entry.offset, entry.length, entry.sha256),
+                )
+            return entry
+
+    @contextmanager
+    def _append_lock(self) -> Iterator[None]:
+        fd = os.open(self.root / APPEND_LOCK_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def extract(self, name: str, target: Path) -> ShardEntry:
+        entry = self.lookup(name)
+        if entry is None:
+            raise KeyError(name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with self.shard_path(entry.shard).open("rb") as src, target.open("wb") as dst:
+            copy_range(src.fileno(), dst.fileno(), entry.length, src_offset=entry.offset)
+        return entry
+
+
+_stores: dict[Path, ShardStore] = {}
+_stores_lock = threading.Lock()
+
+
+def shard_root(config: AppConfig, repo: RepoType) -> Path:
+    return config.paths.output_dir / repo.value / SHARDS_DIRNAME
+
+
+def get_shard_store(config: AppConfig, repo: RepoType) -> ShardStore | None:
+    if not config.shards.enabled or repo.value not in config.shards.repos:
+        return None
+    root = shard_root(config, repo).resolve()
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = ShardStore(root, config.shards.max_shard_bytes, fsync=config.storage.fsync)
+            _stores[root] = store
+        return store
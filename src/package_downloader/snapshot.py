@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from pydantic import BaseModel
+
+from package_downloader.io import json_value
+from package_downloader.models import RepoType
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    repo TEXT NOT NULL,
+    key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    sha256 TEXT,
+    size INTEGER,
+    PRIMARY KEY (repo, key)
+) WITHOUT ROWID
+"""
+
+_MMAP_SIZE = 1024**3
+
+
+class SnapshotEntry(BaseModel):
+    url: str
+    sha256: str | None = None
+    size: int | None = None
+
+
+class SnapshotIndex:
+    def __init__(self, path: Path) -> None:
+        if not path.exists():
+            raise FileNotFoundError(f"Snapshot not found: {path}")
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+            conn.execute(f"PRAGMA mmap_size = {_MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, repo: RepoType, key: str) -> SnapshotEntry | None:
+        row = self._connection().execute(
+            "SELECT url, sha256, size FROM entries WHERE repo = ? AND key = ?",
+            (repo.value, key),
+        ).fetchone()
+        if row is None:
+            return None
+        return SnapshotEntry(url=row[0], sha256=row[1], size=row[2])
+
+
+def open_snapshot(path: Path | None) -> SnapshotIndex | None:
+    if path is None:
+        return None
+    return SnapshotIndex(path)
+
+
+def pypi_key(filename: str) -> str:
+    return filename.strip()
+
+
+def npm_key(npm_name: str, npm_version: str) -> str:
+    return f"{npm_name.strip()}@{npm_version.strip()}"
+
+
+def maven_key(node_path: str, node_name: str) -> str:
+    return f"{node_path.strip().strip('/')}/{node_name.strip()}".lstrip("/")
+
+
+def _iter_records(path: Path) -> Iterator[dict[str, Any] | None]:
+    with path.open("r", encoding="utf-8", newline="") as handle:
+        if path.suffix == ".jsonl":
+            for line in handle:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                if not isinstance(row, dict):
+                    yield None
+                    continue
+                yield {str(key): json_value(value) for key, value in row.items()}
+        else:
+            yield from csv.DictReader(handle)
+
+
+def _record_key(repo: RepoType, record: dict[str, Any]) -> str | None:
+    if record.get("key"):
+        return str(record["key"])
+    if repo == RepoType.PYPI:
+        filename = record.get("filename") or record.get("node_name")
+        return pypi_key(str(filename)) if filename else None
+    if repo == RepoType.NPM:
+        name = record.get("name") or record.get("npm_name")
+        version = record.get("version") or record.get("npm_version")
+        return npm_key(str(name), str(version)) if name and version else None
+    if repo == RepoType.MAVEN:
+        if record.get("path"):
+            return str(record["path"]).strip().lstrip("/")
+        node_path = record.get("node_path")
+        node_name = record.get("node_name")
+        return maven_key(str(node_path), str(node_name)) if node_path and node_name else None
+    return None
+
+
+def _record_entry(repo: RepoType, key: str, record: dict[str, Any]) -> SnapshotEntry | None:
+    url = record.get("url") or record.get("tarball")
+    if not url and repo == RepoType.MAVEN and record.get("registry"):
+        url = f"{str(record['registry']).rstrip('/')}/{key}"
+    if not url:
+        return None
+    digests = record.get("digests") if isinstance(record.get("digests"), dict) else {}
+    size = record.get("size")
+    sha256 = record.get("sha256") or digests.get("sha256") or None
+    return SnapshotEntry(
+        url=str(url),
+        sha256=str(sha256) if sha256 else None,
+        size=int(size) if size not in (None, "") else None,
+    )
+
+
+def build_snapshot(repo: RepoType, inputs: Iterable[Path], output: Path, batch_size: int = 10_000) -> tuple[int, int]:
+    """Write ``repo``'s entries to ``output``, replacing any the file held before.
+
+    The snapshot is built in a sibling temp file and renamed into place, so
+    downloaders reading the old file are never exposed to a partial build.
+    Entries for other repos are carried over from the existing file.
+    """
+    output.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    written = 0
+    skipped = 0
+    conn = sqlite3.connect(temp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(_SCHEMA)
+        if output.exists():
+            conn.execute("ATTACH DATABASE ? AS previous", (str(output),))
+            conn.execute("INSERT INTO entries SELECT * FROM previous.entries WHERE repo != ?", (repo.value,))
+            conn.commit()
+            conn.execute("DETACH DATABASE previous")
+        pending: list[tuple[str, str, str, str | None, int | None]] = []
+        for path in inputs:
+            for record in _iter_records(path):
+                try:
+                    key = _record_key(repo, record) if record else None
+                    entry = _record_entry(repo, key, record) if key else None
+                except (TypeError, ValueError):
+                    entry = None
+                if entry is None:
+                    skipped += 1
+                    continue
+                pending.append((repo.value, key, entry.url, entry.sha256, entry.size))
+                if len(pending) >= batch_size:
+                    conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", pending)
+                    written += len(pending)
+                    pending = []
+        if pending:
+            conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", pending)
+            written += len(pending)
+        conn.commit()
+        conn.close()
+        os.replace(temp_path, output)
+    except BaseException:
+        conn.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+    return written, skipped
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import errno
+import multiprocessing
+import os
+from pathlib import Path
+from threading import Event, Lock
+from typing import Callable
+
+import httpx
+
+from package_downloader.config import AppConfig, StorageConfig
+from package_downloader.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+STAGING_DIRNAME = ".staging"
+WORKER_STAGING_PREFIX = "proc-"
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+def _device_of(path: Path) -> int:
+    probe = path
+    while not probe.exists():
+        if probe.parent == probe:
+            break
+        probe = probe.parent
+    return os.stat(probe).st_dev
+
+
+def same_device(left: Path, right: Path) -> bool:
+    try:
+        return _device_of(left) == _device_of(right)
+    except OSError:
+        return False
+
+
+def staging_dir(config: AppConfig, repo_name: str) -> Path:
+    staged = config.paths.temp_dir / repo_name
+    # Cross-device commits turn into full copies, so stage next to the output instead.
+    if config.storage.stage_per_device and not same_device(config.paths.temp_dir, config.paths.output_dir):
+        staged = config.paths.output_dir / STAGING_DIRNAME / repo_name
+        logger.info(
+            "temp_dir and output_dir are on different devices; staging %s in %s",
+            repo_name,
+            staged,
+        )
+    # Worker processes do not share single-flight state, so keep their partial files apart.
+    if multiprocessing.parent_process() is not None:
+        staged = staged / f"{WORKER_STAGING_PREFIX}{os.getpid()}"
+    return staged
+
+
+def content_length(response: httpx.Response) -> int | None:
+    encoding = response.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("", "identity"):
+        return None
+    value = response.headers.get("content-length")
+    if not value:
+        return None
+    try:
+        length = int(value)
+    except ValueError:
+        return None
+    return length if length > 0 else None
+
+
+def _preallocate(fd: int, length: int) -> bool:
+    if not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, length)
+    except OSError as exc:
+        logger.debug("posix_fallocate unsupported for fd %s: %s", fd, exc)
+        return False
+    return True
+
+
+def write_response(
+    response: httpx.Response,
+    target_path: Path,
+    config: StorageConfig,
+    cancel: Event | None = None,
+    on_write: Callable[[int], None] | None = None,
+) -> int:
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    expected = content_length(response)
+    written = 0
+    with target_path.open("wb", buffering=config.write_buffer_size) as handle:
+        preallocated = False
+        if config.preallocate and expected:
+            preallocated = _preallocate(handle.fileno(), expected)
+            if preallocated and on_write is not None:
+                # The whole file is already allocated on disk, so it all counts as written.
+                on_write(expected)
+        for chunk in response.iter_bytes(chunk_size=config.read_chunk_size):
+            if cancel is not None and cancel.is_set():
+                raise TransferCancelled(str(response.url))
+            handle.write(chunk)
+            written += len(chunk)
+            if on_write is not None and not preallocated:
+                on_write(len(chunk))
+        handle.flush()
+        if expected and written != expected:
+            handle.truncate(written)
+    return written
+
+
+def copy_range(
+    src_fd: int,
+    dst_fd: int,
+    size: int,
+    src_offset: int = 0,
+    dst_offset: int = 0,
+    chunk_size: int = 1024 * 1024,
+) -> None:
+    copied = 0
+    while copied < size:
+        try:
+            if hasattr(os, "copy_file_range"):
+                count = os.copy_file_range(src_fd, dst_fd, size - copied, src_offset + copied, dst_offset + copied)
+            else:
+                os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+                count = os.sendfile(dst_fd, src_fd, src_offset + copied, size - copied)
+        except OSError:
+            break
+        if count == 0:
+            break
+        copied += count
+    while copied < size:
+        chunk = os.pread(src_fd, min(chunk_size, size - copied), src_offset + copied)
+        if not chunk:
+            raise OSError(f"Unexpected end of file after {copied} of {size} bytes.")
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(dst_fd, view, dst_offset + copied)
+            view = view[written:]
+            copied += written
+
+
+def _copy_file(source: Path, target: Path, chunk_size: int) -> None:
+    with source.open("rb") as src, target.open("wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        if size:
+            _preallocate(dst.fileno(), size)
+        copy_range(src.fileno(), dst.fileno(), size, chunk_size=chunk_size)
+
+
+def commit_file(temp_path: Path, final_path: Path, config: StorageConfig, durable: bool = False) -> None:
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(temp_path, final_path)
+        return
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            raise
+    partial = final_path.with_name(f"{final_path.name}.partial")
+    try:
+        _copy_file(temp_path, partial, config.read_chunk_size)
+        if durable:
+            _fsync_path(partial)
+        os.replace(partial, final_path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    temp_path.unlink(missing_ok=True)
+
+
+class FsyncBatcher:
+    """Moves staged files into place, durably when ``storage.fsync`` is on.
+
+    With fsync enabled, commits are held until a batch fills or ``flush``
+    runs. The batch then fsyncs the temp files, renames them, and fsyncs
+    the target directories. That way a crash can never leave a partial
+    file at a final path that a replay would then skip as already present.
+    """
+
+    def __init__(self, config: StorageConfig) -> None:
+        self.config = config
+        self.enabled = config.fsync
+        self.batch_size = config.fsync_batch_size
+        self._queued: dict[Path, Path] = {}
+        self._committing: dict[Path, Path] = {}
+        self._lock = Lock()
+
+    def commit(self, temp_path: Path, final_path: Path) -> None:
+        if not self.enabled:
+            commit_file(temp_path, final_path, self.config)
+            return
+        with self._lock:
+            self._queued[final_path] = temp_path
+            if len(self._queued) < self.batch_size:
+                return
+            batch = self._take()
+        self._commit(batch)
+
+    def pending(self, final_path: Path) -> bool:
+        with self._lock:
+            return final_path in self._queued or final_path in self._committing
+
+    def flush(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            batch = self._take()
+        self._commit(batch)
+
+    def _take(self) -> dict[Path, Path]:
+        batch, self._queued = self._queued, {}
+        self._committing.update(batch)
+        return batch
+
+    def _commit(self, batch: dict[Path, Path]) -> None:
+        if not batch:
+            return
+        error: BaseException | None = None
+        try:
+            for temp_path in batch.values():
+                _fsync_path(temp_path)
+            for final_path, temp_path in batch.items():
+                try:
+                    commit_file(temp_path, final_path, self.config, durable=True)
+                except OSError as exc:
+                    logger.error("Could not commit %s: %s", final_path, exc)
+                    error = error or exc
+            for directory in {final_path.parent for final_path in batch}:
+                _fsync_path(directory)
+        finally:
+            with self._lock:
+                for final_path in batch:
+                    self._committing.pop(final_path, None)
+        # Surfacing the failure keeps the caller from saving an offset past these rows.
+        if error is not None:
+            raise error
+
+
+def _fsync_path(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
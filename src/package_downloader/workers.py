@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing.queues import SimpleQueue
+from pathlib import Path
+from time import monotonic
+
+from rich.progress import Progress, TaskID
+
+from package_downloader.batcher import iter_batches, new_progress, run_batch, start_task
+from package_downloader.config import AppConfig
+from package_downloader.errors import append_error
+from package_downloader.io import count_packages
+from package_downloader.logging_utils import get_logger, setup_logging
+from package_downloader.models import BatchSummary, DownloadStatus, ErrorRecord, OffsetState, PackageRecord, RepoType
+from package_downloader.offsets import load_offset, save_offset
+from package_downloader.repos import get_downloader
+from package_downloader.storage import WORKER_STAGING_PREFIX, staging_dir
+
+logger = get_logger(__name__)
+
+_PROGRESS_INTERVAL = 0.25
+
+
+class _ProgressReporter:
+    def __init__(self, updates: SimpleQueue) -> None:
+        self._updates = updates
+        self._pending = 0
+        self._sent_at = monotonic()
+        self._lock = threading.Lock()
+
+    def advance(self) -> None:
+        with self._lock:
+            self._pending += 1
+            if monotonic() - self._sent_at >= _PROGRESS_INTERVAL:
+                self._send()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._send()
+
+    def _send(self) -> None:
+        if self._pending:
+            self._updates.put(self._pending)
+            self._pending = 0
+        self._sent_at = monotonic()
+
+
+class _Worker:
+    def __init__(self, repo: RepoType, config: AppConfig, updates: SimpleQueue) -> None:
+        self.repo = repo
+        self.config = config
+        self.downloader = get_downloader(repo, config)
+        self.resolver = ThreadPoolExecutor(
+            max_workers=config.download.resolve_workers,
+            thread_name_prefix="resolve",
+        )
+        self.transfers = ThreadPoolExecutor(
+            max_workers=config.download.max_workers,
+            thread_name_prefix="transfer",
+        )
+        self.progress = _ProgressReporter(updates)
+
+    def run(self, packages: list[PackageRecord]) -> BatchSummary:
+        try:
+            result = run_batch(
+                self.repo,
+                self.config,
+                self.downloader,
+                packages,
+                resolver=self.resolver,
+                transfers=self.transfers,
+                fail_fast=self.config.download.fail_fast,
+                advance=self.progress.advance,
+                record_errors=False,
+            )
+            self.downloader.flush()
+        finally:
+            self.progress.flush()
+
+        summary = BatchSummary()
+        for item in result.results:
+            if item.status == DownloadStatus.DOWNLOADED:
+                summary.downloaded += 1
+            elif item.status == DownloadStatus.SKIPPED:
+                summary.skipped += 1
+            else:
+                summary.errors.append(
+                    ErrorRecord(
+                        repo=self.repo,
+                        message=item.message or "unknown error",
+                        raw=item.package.raw,
+                    )
+                )
+        return summary
+
+
+_worker: _Worker | None = None
+
+
+def _init_worker(repo_value: str, config_json: str, updates: SimpleQueue) -> None:
+    global _worker
+    setup_logging()
+    _worker = _Worker(RepoType(repo_value), AppConfig.model_validate_json(config_json), updates)
+
+
+def _run_worker_batch(packages: list[PackageRecord]) -> BatchSummary:
+    if _worker is None:
+        raise RuntimeError("Worker process was not initialized.")
+    return _worker.run(packages)
+
+
+def _drain_progress(updates: SimpleQueue, progress: Progress, task_id: TaskID) -> None:
+    while True:
+        count = updates.get()
+        if count is None:
+            return
+        progress.advance(task_id, count)
+
+
+def _record_summary(config: AppConfig, summary: BatchSummary) -> None:
+    for record in summary.errors:
+        logger.error("Download failed: %s", record.message)
+        append_error(config.paths.errors_dir, record)
+
+
+def _remove_worker_staging(config: AppConfig, repo: RepoType) -> None:
+    root = staging_dir(config, repo.value)
+    if not root.is_dir():
+        return
+    for path in root.glob(f"{WORKER_STAGING_PREFIX}*"):
+        # Only empty trees are removed; leftovers from failed transfers stay for inspection.
+        for dirpath, _, _ in os.walk(path, topdown=False):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+
+def run_parallel_downloads(repo: RepoType, input_file: Path, config: AppConfig) -> None:
+    """Split the row stream across ``download.processes`` worker processes.
+
+    The parent reads and de-duplicates rows, hands whole batches to workers
+    and keeps the offset, error log and progress bar. Each worker runs its
+    own downloader and thread pools. Registry metadata and disk admission
+    reservations are shared through file-locked directories, so a package is
+    looked up once and the free-space floor holds across all workers.
+    """
+    processes = config.download.processes
+    offset_state = load_offset(config.paths.offsets_dir, repo)
+    offset = max(offset_state.offset, 0)
+    total = count_packages(input_file, config.input)
+
+    config.paths.temp_dir.mkdir(parents=True, exist_ok=True)
+    run_dir = Path(tempfile.mkdtemp(prefix="run-", dir=config.paths.temp_dir))
+    worker_config = config.model_copy(deep=True)
+    if worker_config.download.metadata_cache is None:
+        worker_config.download.metadata_cache = run_dir / "metadata"
+    if worker_config.admission.ledger_dir is None:
+        worker_config.admission.ledger_dir = run_dir / "admission"
+
+    context = multiprocessing.get_context("spawn")
+    updates = context.SimpleQueue()
+    progress = new_progress()
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(repo.value, worker_config.model_dump_json(), updates),
+    )
+    # Batches finish out of order; the offset only moves past a contiguous prefix.
+    window: deque[tuple[int, Future[BatchSummary] | None]] = deque()
+
+    def settle(block: bool) -> None:
+        running = [future for _, future in window if future is not None and not future.done()]
+        if block and running:
+            wait(running, return_when=FIRST_COMPLETED)
+        while window and (window[0][1] is None or window[0][1].done()):
+            batch_offset, future = window.popleft()
+            if future is not None:
+                _record_summary(config, future.result())
+            save_offset(config.paths.offsets_dir, repo, OffsetState(offset=batch_offset))
+
+    try:
+        with progress:
+            task_id = start_task(progress, repo, total, offset)
+            drain = threading.Thread(target=_drain_progress, args=(updates, progress, task_id), daemon=True)
+            drain.start()
+
+            def advance() -> None:
+                progress.advance(task_id)
+
+            try:
+                for batch, batch_offset in iter_batches(input_file, config, offset, advance):
+                    future = pool.submit(_run_worker_batch, batch) if batch else None
+                    window.append((batch_offset, future))
+                    settle(block=False)
+                    while len(window) >= processes * 2:
+                        settle(block=True)
+                while window:
+                    settle(block=True)
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+                updates.put(None)
+                drain.join()
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        _remove_worker_staging(config, repo)